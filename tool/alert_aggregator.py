@@ -0,0 +1,123 @@
+import time
+import hashlib
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from urllib.parse import urlparse
+from config import ALERT_CONFIG
+
+RATE_LIMITED_ALERT = "Alert rate limit exceeded"
+
+
+def alert_fingerprint(alert_type, url=None, rule=None, window=None):
+    """Identify an incident by (type, url, rule) within a time window bucket."""
+    key = '\x1f'.join(str(part) if part is not None else '' for part in (alert_type, url, rule, window))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class AlertAggregator:
+    """
+    Decides how a raised alert is recorded. Repeats of an incident within
+    the same window are coalesced into its hit counter, and each source
+    (the page's host, or the alert type when there is no url) may open new
+    incidents at a limited rate. Alerts over the limit are folded into one
+    rate-limit incident per source and window.
+
+    Hits that do not open an incident are only counted here; their
+    per-incident totals are written as one batch every `flush_interval`
+    seconds or with any flush of the database's batched writer.
+    """
+
+    NEW = 'new'
+    REPEAT = 'repeat'
+    LIMITED = 'limited'
+
+    def __init__(self, window=None, rate=None, burst=None, max_tracked=10000, flush_interval=None):
+        rate_limit = ALERT_CONFIG.get('rate_limit', {})
+        self.window = window or ALERT_CONFIG.get('dedup_window', 3600)
+        self.flush_interval = flush_interval if flush_interval is not None else ALERT_CONFIG.get('hit_flush_interval', 5.0)
+        self.rate = rate if rate is not None else rate_limit.get('rate', 1.0)
+        self.burst = burst if burst is not None else rate_limit.get('burst', 20)
+        self.max_tracked = max_tracked
+        self.incidents = OrderedDict()     # fingerprints opened recently, oldest first
+        self.buckets = OrderedDict()       # source -> TokenBucket
+        self.suppressed = {}               # fingerprint -> [type, content, severity, hits, first, last] not yet written
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def current_window(self):
+        return int(time.time() // self.window)
+
+    @staticmethod
+    def source_of(alert_type, url):
+        return (urlparse(url).hostname or url) if url else alert_type
+
+    def classify(self, alert_type, url=None, rule=None):
+        """
+        Return (decision, alert_type, fingerprint) for a raised alert.
+        A LIMITED decision carries the rate-limit incident's type and
+        fingerprint in place of the original ones.
+        """
+        window = self.current_window()
+        fingerprint = alert_fingerprint(alert_type, url, rule, window)
+        with self.lock:
+            if fingerprint in self.incidents:
+                self.incidents.move_to_end(fingerprint)
+                return self.REPEAT, alert_type, fingerprint
+
+            source = self.source_of(alert_type, url)
+            bucket = self.buckets.get(source)
+            if bucket is None:
+                bucket = self.buckets[source] = TokenBucket(self.rate, self.burst)
+                self._trim(self.buckets)
+            self.buckets.move_to_end(source)
+            if not bucket.take():
+                return self.LIMITED, RATE_LIMITED_ALERT, alert_fingerprint(RATE_LIMITED_ALERT, source, None, window)
+
+            self.incidents[fingerprint] = window
+            self._trim(self.incidents)
+            return self.NEW, alert_type, fingerprint
+
+    def count_suppressed(self, fingerprint, alert_type, content, severity):
+        """Count a REPEAT or LIMITED hit; True once the counted hits are due to be written."""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            entry = self.suppressed.get(fingerprint)
+            if entry is None:
+                self.suppressed[fingerprint] = [alert_type, content, severity, 1, now, now]
+            else:
+                entry[2] = max(entry[2], severity)
+                entry[3] += 1
+                entry[5] = now
+            return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def take_suppressed(self):
+        """Return ALERT_INSERT_SQL rows adding the counted hits to their incidents, and reset the counts."""
+        with self.lock:
+            suppressed, self.suppressed = self.suppressed, {}
+            self.last_flush = time.monotonic()
+        return [(alert_type, content, severity, first, "new", fingerprint, hits, last)
+                for fingerprint, (alert_type, content, severity, hits, first, last) in suppressed.items()]
+
+    def _trim(self, entries):
+        while len(entries) > self.max_tracked:
+            entries.popitem(last=False)
@@ -0,0 +1,192 @@
+import re
+import json
+import hashlib
+import importlib
+from collections import namedtuple
+from keyword_matcher import KeywordMatcher
+
+RuleHit = namedtuple('RuleHit', ['rule', 'match', 'severity'])
+
+# Used when ALERT_CONFIG has no 'pattern_rules' entry
+DEFAULT_PATTERN_RULES = {
+    'credit_card': {'pattern': r'\b\d{4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}\b', 'validator': 'luhn'},
+    'ssn': {'pattern': r'\b\d{3}[- ]?\d{2}[- ]?\d{4}\b'},
+    'email': {'pattern': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', 'requires': '@'},
+}
+
+
+def luhn_valid(number):
+    """Return True if the digits in `number` pass the Luhn checksum."""
+    digits = [int(ch) for ch in number if ch.isdigit()]
+    if len(digits) < 12:
+        return False
+    checksum = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+VALIDATORS = {
+    'luhn': luhn_valid,
+}
+
+# Constructs whose meaning changes once a pattern is joined into the combined regex:
+# backreferences (numbered groups shift, named ones may clash) and global inline flags
+UNCOMBINABLE_PATTERN = re.compile(r'(?<!\\)(?:\\\\)*\\(?:[1-9]|g<)|\(\?P=|\(\?[aiLmsux]+\)')
+
+
+class AlertRuleEngine:
+    """
+    Compiles the alert rules from ALERT_CONFIG once into a single combined
+    regex plus a keyword matcher, and reports which rule fired.
+
+    'pattern_rules' maps a rule name to a regex string or to a dict with
+    'pattern' and optional 'validator' ('luhn'), 'severity' and 'requires'
+    keys. 'requires' is a literal every match contains; texts without it
+    are scanned without that rule.
+    """
+
+    def __init__(self, alert_config=None):
+        self.alert_config = alert_config
+        if alert_config is None:
+            from config import ALERT_CONFIG
+            alert_config = ALERT_CONFIG
+        self._compile(alert_config)
+
+    def reload(self, alert_config=None):
+        """
+        Recompile the rules. With no explicit config, the config module is
+        re-imported so edits to ALERT_CONFIG apply without a restart.
+        """
+        if alert_config is None:
+            alert_config = self.alert_config
+        if alert_config is None:
+            import config
+            try:
+                config = importlib.reload(config)
+            except ImportError:
+                # Not loaded from a file (e.g. built in memory), so there is nothing to re-read
+                pass
+            alert_config = config.ALERT_CONFIG
+        self._compile(alert_config)
+
+    def _compile(self, alert_config):
+        severity_levels = alert_config.get('severity_levels', {})
+        default_severity = severity_levels.get('medium', 5)
+        rules = []
+        definitions = []
+        for name, spec in alert_config.get('pattern_rules', DEFAULT_PATTERN_RULES).items():
+            if isinstance(spec, str):
+                spec = {'pattern': spec}
+            validator = spec.get('validator')
+            if validator and validator not in VALIDATORS:
+                raise ValueError(f"Unknown validator '{validator}' for alert rule '{name}'")
+            if UNCOMBINABLE_PATTERN.search(spec['pattern']):
+                raise ValueError(f"Alert rule '{name}' uses a backreference or global inline flag; "
+                                 f"use a scoped flag group such as (?i:...) instead")
+            rules.append((name, spec['pattern'], VALIDATORS.get(validator),
+                          spec.get('severity', default_severity), spec.get('requires')))
+            definitions.append([name, spec['pattern'], validator, rules[-1][3], rules[-1][4]])
+        keywords = alert_config.get('high_risk_keywords', [])
+
+        # Build everything first and swap in one step, so concurrent scans see either rule set
+        groups = {f'r{i}': rule for i, rule in enumerate(rules)}
+        # One combined regex for the ungated rules and one per required literal,
+        # so a text without the literal is never scanned for its rules
+        passes = []
+        for literal in dict.fromkeys(rule[4] for rule in rules):
+            passes.append((literal, self._combine({group: rule[1] for group, rule in groups.items()
+                                                   if rule[4] == literal})))
+        passes.sort(key=lambda item: item[0] is not None)
+
+        self._state = (groups, passes, {rule[0]: re.compile(rule[1]) for rule in rules})
+        self._keywords = KeywordMatcher(keywords)
+        self.keyword_severity = severity_levels.get('high', 8)
+        self.rule_names = [rule[0] for rule in rules]
+        self.config = alert_config
+        # Changes whenever a rule or keyword is added, removed or edited
+        self.fingerprint = hashlib.sha256(json.dumps(
+            {'rules': definitions, 'keywords': sorted(keywords), 'keyword_severity': self.keyword_severity}
+        ).encode()).hexdigest()
+
+    @staticmethod
+    def _combine(patterns):
+        """Join patterns into one regex with a named group per rule."""
+        if not patterns:
+            return None
+        # A shared leading word boundary is tested once per position instead of once per rule
+        prefix = r'\b' if all(pattern.startswith(r'\b') for pattern in patterns.values()) else ''
+        return re.compile(prefix + '(?:' + '|'.join(
+            f'(?P<{group}>{pattern[len(prefix):]})' for group, pattern in patterns.items()
+        ) + ')')
+
+    # ---------------- Keywords ----------------
+    def is_high_risk_keyword(self, keyword):
+        """Return True if any high-risk keyword occurs in `keyword`."""
+        return self._keywords.matches(keyword)
+
+    def find_keywords(self, text):
+        """Return the high-risk keywords that occur in `text`."""
+        return self._keywords.find(text)
+
+    # ---------------- Patterns ----------------
+    def scan(self, text, first_only=False):
+        """
+        Return a RuleHit for each rule whose pattern matches `text`, with the
+        first accepted match for that rule. As when each rule is searched on
+        its own, a rule is reported even if its match overlaps another rule's.
+        """
+        groups, passes, compiled = self._state
+        if not text:
+            return []
+        hits = {}
+        spans = []
+        for literal, pattern in passes:
+            if literal is not None and literal not in text:
+                continue
+            for match in pattern.finditer(text):
+                spans.append(match.span())
+                name, _, validator, severity, _ = groups[match.lastgroup]
+                if name in hits:
+                    continue
+                value = match.group()
+                if validator is None or validator(value):
+                    hits[name] = RuleHit(name, value, severity)
+                    if first_only or len(hits) == len(groups):
+                        return list(hits.values())
+
+        # The alternation consumes each match, so a rule whose match starts inside
+        # another rule's (or was rejected by a validator) is only found by rescanning
+        # those spans; every other start position was already tried for every rule
+        if spans:
+            spans.sort()
+            for name, _, validator, severity, literal in groups.values():
+                if name in hits or (literal is not None and literal not in text):
+                    continue
+                value = self._search_spans(compiled[name], validator, text, spans)
+                if value is not None:
+                    hits[name] = RuleHit(name, value, severity)
+                    if first_only:
+                        break
+        return list(hits.values())
+
+    @staticmethod
+    def _search_spans(regex, validator, text, spans):
+        """First match of `regex` starting inside one of `spans` that `validator` accepts."""
+        # Anchored tries at each position stay within the span instead of scanning the rest of the text
+        tried = 0
+        for start, end in spans:
+            for pos in range(max(start, tried), max(end, start + 1)):
+                match = regex.match(text, pos)
+                if match and (validator is None or validator(match.group())):
+                    return match.group()
+            tried = max(tried, end)
+        return None
+
+    def matches(self, text):
+        """Return True if any pattern rule fires on `text`."""
+        return bool(self.scan(text, first_only=True))
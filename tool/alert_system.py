@@ -1,10 +1,23 @@
-import re
-from datetime import datetime
-from config import ALERT_CONFIG
+from alert_rules import AlertRuleEngine
+from alert_scan import AlertScanner
+from alert_aggregator import AlertAggregator
+from database import ALERT_INSERT_SQL
 
 class AlertSystem:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, rule_engine=None, aggregator=None):
         self.db_manager = db_manager
+        self.rules = rule_engine or AlertRuleEngine()
+        self.aggregator = aggregator or AlertAggregator()
+        db_manager.add_flush_listener(self.suppressed_writes)
+
+    def reload_rules(self):
+        """Recompile alert rules from the current ALERT_CONFIG."""
+        self.rules.reload()
+
+    def scan_stored_pages(self, full=False, workers=None):
+        """Run the alert rules over stored pages that changed since the last scan."""
+        return AlertScanner(self.db_manager, rule_engine=self.rules, workers=workers,
+                            aggregator=self.aggregator).run(full=full)
 
     # ---------------- Keyword Alert Checks ----------------
     def check_keyword_alerts(self, keyword, results):
@@ -12,51 +25,71 @@ class AlertSystem:
         Check if a keyword search triggers alerts based on high-risk keywords
         or suspicious patterns in results.
         """
-        keyword_lower = keyword.lower()
+        self.check_keyword_risk(keyword, len(results))
+        for result in results:
+            self.check_result_alerts(result)
 
-        # High-risk keyword check
-        if any(risk_word.lower() in keyword_lower for risk_word in ALERT_CONFIG['high_risk_keywords']):
+    def check_keyword_risk(self, keyword, result_count):
+        """Alert once if the searched keyword itself is high-risk."""
+        if self.rules.is_high_risk_keyword(keyword):
             self.create_alert(
                 alert_type="High-risk keyword detected",
-                content=f"Keyword '{keyword}' found in {len(results)} results",
-                severity=ALERT_CONFIG['severity_levels'].get('high', 8)
+                content=f"Keyword '{keyword}' found in {result_count} results",
+                severity=self.rules.keyword_severity,
+                rule=keyword.lower()
             )
 
-        # Check results for suspicious patterns
-        for result in results:
-            snippet = result.get('snippet', '')
-            if self._contains_suspicious_pattern(snippet):
-                self.create_alert(
-                    alert_type="Suspicious content detected",
-                    content=f"Suspicious pattern found in result: {result.get('url', 'Unknown')}",
-                    severity=ALERT_CONFIG['severity_levels'].get('medium', 5)
-                )
+    def check_result_alerts(self, result):
+        """Alert if a single search result's snippet contains suspicious patterns."""
+        hits = self.rules.scan(result.get('snippet', ''))
+        if hits:
+            rules = ', '.join(hit.rule for hit in hits)
+            self.create_alert(
+                alert_type="Suspicious content detected",
+                content=f"Suspicious pattern ({rules}) found in result: {result.get('url', 'Unknown')}",
+                severity=max(hit.severity for hit in hits),
+                url=result.get('url'),
+                rule=rules
+            )
 
     # ---------------- Suspicious Pattern Detection ----------------
     def _contains_suspicious_pattern(self, text):
         """Return True if text contains suspicious patterns like credit cards, SSNs, or emails."""
-        suspicious_patterns = [
-            r'\b\d{4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}\b',  # Credit card numbers
-            r'\b\d{3}[- ]?\d{2}[- ]?\d{4}\b',            # SSN pattern
-            r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b',  # Emails
-        ]
-        return any(re.search(pattern, text) for pattern in suspicious_patterns)
+        return self.rules.matches(text)
 
     # ---------------- Create Alert ----------------
-    def create_alert(self, alert_type, content, severity=5):
-        """Insert a new alert into the database."""
-        try:
-            cursor = self.db_manager.conn.cursor()
-            cursor.execute('''
-                INSERT INTO alerts (type, content, severity, date_created, status)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (alert_type, content, severity, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "new"))
-            self.db_manager.conn.commit()
-            print(f"[!] ALERT: {alert_type} | Severity: {severity}/10 | {content}")
+    def create_alert(self, alert_type, content, severity=5, url=None, rule=None):
+        """
+        Queue an alert on the database's batched writer. Repeats of an
+        incident, identified by (type, url, rule) within the aggregation
+        window, only bump its hit counter. New incidents beyond a source's
+        rate limit are counted under a single rate-limit incident instead.
+        Both kinds of hit are counted in the aggregator and written with
+        flush_suppressed, one row per incident.
+        """
+        decision, stored_type, fingerprint = self.aggregator.classify(alert_type, url, rule)
+        if decision != AlertAggregator.NEW:
+            if decision == AlertAggregator.LIMITED:
+                source = self.aggregator.source_of(alert_type, url)
+                content = f"Alerts from {source} exceeded the rate limit"
+            if self.aggregator.count_suppressed(fingerprint, stored_type, content, severity):
+                self.flush_suppressed()
             return True
-        except Exception as e:
-            print(f"[-] Error creating alert: {str(e)}")
+        if not self.db_manager.store_alert(stored_type, content, severity, status="new", defer=True,
+                                           fingerprint=fingerprint):
+            print("[-] Error creating alert")
             return False
+        print(f"[!] ALERT: {alert_type} | Severity: {severity}/10 | {content}")
+        return True
+
+    def flush_suppressed(self):
+        """Queue the hit counts of suppressed alerts on the batched writer, one row per incident."""
+        for sql, params in self.suppressed_writes():
+            self.db_manager.writer.add(sql, params)
+
+    def suppressed_writes(self):
+        """Statements adding the counted suppressed hits to their incidents; written with every flush."""
+        return [(ALERT_INSERT_SQL, row) for row in self.aggregator.take_suppressed()]
 
     # ---------------- Retrieve Alerts ----------------
     def get_alerts(self, status=None, min_severity=0, limit=50):
@@ -65,7 +98,8 @@ class AlertSystem:
         Can filter by status and minimum severity.
         """
         try:
-            cursor = self.db_manager.conn.cursor()
+            self.db_manager.flush()
+            cursor = self.db_manager.reader().cursor()
             query = '''
                 SELECT * FROM alerts 
                 WHERE severity >= ?
@@ -89,9 +123,8 @@ class AlertSystem:
     def update_alert_status(self, alert_id, status):
         """Update the status of a specific alert."""
         try:
-            cursor = self.db_manager.conn.cursor()
-            cursor.execute('UPDATE alerts SET status = ? WHERE id = ?', (status, alert_id))
-            self.db_manager.conn.commit()
+            self.db_manager.flush()
+            self.db_manager.execute_batches([('UPDATE alerts SET status = ? WHERE id = ?', [(status, alert_id)])])
             print(f"[+] Alert ID {alert_id} status updated to '{status}'")
             return True
         except Exception as e:
@@ -102,9 +135,10 @@ class AlertSystem:
     def bulk_update_alerts(self, alert_ids, status):
         """Update multiple alerts at once."""
         try:
-            cursor = self.db_manager.conn.cursor()
-            cursor.executemany('UPDATE alerts SET status = ? WHERE id = ?', [(status, aid) for aid in alert_ids])
-            self.db_manager.conn.commit()
+            self.db_manager.flush()
+            self.db_manager.execute_batches([
+                ('UPDATE alerts SET status = ? WHERE id = ?', [(status, aid) for aid in alert_ids])
+            ])
             print(f"[+] Bulk updated {len(alert_ids)} alerts to '{status}'")
             return True
         except Exception as e:
@@ -0,0 +1,343 @@
+"""
+Cluster the users table into linked identity groups.
+
+Two users are linked when the character-set Jaccard score of their
+usernames (UserTracker._similarity_score) reaches the threshold, or when
+they share a pgp_key or email. Clusters are the connected components of
+those links and are stored in user_clusters, keyed by the smallest
+username in the cluster.
+
+The name links are found with an exact prefix-filtered similarity join:
+with every character set sorted in one fixed token order (rarest first),
+two sets that reach the threshold share at least k tokens within their
+first |x| - ceil(t * |x|) + k tokens. A rebuild indexes each set by the
+k-token subsets of that prefix and scores only pairs sharing one, so the
+result equals the pairwise definition without comparing every pair.
+Incremental updates probe a stored single-token prefix index instead.
+Users to update are queued in alias_cluster_pending by triggers on the
+users table, so the queue survives restarts and writes from other processes.
+A changed pgp_key or email can remove links as well as add them, so the
+cluster of a requeued user is split up and all its members are linked again.
+
+    python alias_clusters.py [--threshold 0.7]
+"""
+import sys
+import math
+import argparse
+from itertools import combinations
+from collections import defaultdict
+from database import DataBaseManager
+
+# Floating-point slack so the bounds never reject a pair that scores exactly t
+_EPSILON = 1e-9
+
+
+def _ceil(value):
+    return math.ceil(value - _EPSILON)
+
+
+def probe_prefix_length(threshold, size, k=1):
+    """
+    Prefix within which a set shares at least k tokens with any set it
+    reaches the threshold with, for k no larger than ceil(threshold * size).
+    """
+    return size - _ceil(threshold * size) + k
+
+
+def char_mask(name, order):
+    """Bitmask of a name's character set, with each token's bit at its rank."""
+    mask = 0
+    for token in set(name.lower()):
+        mask |= 1 << order[token]
+    return mask
+
+
+def reaches(mask, other, threshold):
+    """UserTracker._similarity_score(...) >= threshold, computed on bitmasks."""
+    shared = (mask & other).bit_count()
+    union = mask.bit_count() + other.bit_count() - shared
+    return union > 0 and shared / union >= threshold
+
+
+class UnionFind:
+    """Disjoint sets whose root is always the smallest member."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if root_b < root_a:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        return root_a
+
+
+class AliasClusterer:
+    def __init__(self, db_manager, threshold=0.7, batch_size=500, subset_size=4):
+        self.db_manager = db_manager
+        self.threshold = threshold
+        self.subset_size = subset_size
+        self.batch_size = batch_size
+
+    # ---------------- Full Build ----------------
+    def rebuild(self):
+        """Cluster every user from scratch and replace the stored clusters."""
+        self.db_manager.flush()
+        cursor = self.db_manager.reader().cursor()
+        # Users queued after this point are stored after the read below and stay queued
+        queued_upto = cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM alias_cluster_pending').fetchone()[0]
+        cursor.execute('SELECT username, pgp_key, email FROM users WHERE username IS NOT NULL')
+        users = cursor.fetchall()
+
+        # Rarest tokens first keeps prefixes, and so candidate lists, short
+        frequency = defaultdict(int)
+        for username, _, _ in users:
+            for token in set(username.lower()):
+                frequency[token] += 1
+        order = {token: rank for rank, token in enumerate(sorted(frequency, key=lambda t: (frequency[t], t)))}
+
+        clusters = UnionFind()
+        for username, _, _ in users:
+            clusters.find(username)
+        for a, b in self._similar_links([username for username, _, _ in users], order):
+            clusters.union(a, b)
+        for a, b in self._shared_identity_pairs(users):
+            clusters.union(a, b)
+
+        prefix_rows = []
+        for username, _, _ in users:
+            tokens = sorted(set(username.lower()), key=order.__getitem__)
+            prefix_rows.extend((token, username, len(tokens))
+                               for token in tokens[:probe_prefix_length(self.threshold, len(tokens))])
+        self.db_manager.execute_batches([
+            ('DELETE FROM user_clusters', [()]),
+            ('DELETE FROM alias_prefix_tokens', [()]),
+            ('DELETE FROM alias_token_order', [()]),
+            ('DELETE FROM alias_cluster_state', [()]),
+            ('DELETE FROM alias_cluster_pending WHERE seq <= ?', [(queued_upto,)]),
+            ('INSERT INTO alias_token_order (token, rank) VALUES (?, ?)', list(order.items())),
+            ('INSERT INTO alias_prefix_tokens (token, username, size) VALUES (?, ?, ?)', prefix_rows),
+            ('INSERT INTO user_clusters (username, cluster_id) VALUES (?, ?)',
+             [(username, clusters.find(username)) for username, _, _ in users]),
+            ('INSERT INTO alias_cluster_state (name, value) VALUES (?, ?)', [('threshold', repr(self.threshold))]),
+        ])
+        linked = sum(1 for username, _, _ in users if clusters.find(username) != username)
+        print(f"[+] Clustered {len(users)} users; {linked} linked into larger identity groups")
+        return len(users)
+
+    def _similar_links(self, usernames, order):
+        """
+        Yield username pairs that connect every pair whose score reaches the
+        threshold: names with the same character set are chained together,
+        and similar sets are joined through one name each.
+        """
+        threshold = self.threshold
+        groups = defaultdict(list)              # character-set bitmask -> usernames
+        for username in usernames:
+            groups[char_mask(username, order)].append(username)
+        for mask, members in groups.items():
+            # Identical non-empty sets score 1.0
+            if mask:
+                yield from zip(members, members[1:])
+
+        # (set size, k, k rarest-first prefix tokens) -> masks of that size holding them
+        index = defaultdict(list)
+        probes = []
+        for mask in groups:
+            if not mask:
+                continue
+            size = mask.bit_count()
+            # Bits are ranked rarest first, so the lowest set bits are the prefix
+            tokens = [bit for bit in range(mask.bit_length()) if mask >> bit & 1]
+            partners = [(other_size, self._subset_size(size, other_size))
+                        for other_size in range(_ceil(threshold * size),
+                                                math.floor(size / threshold + _EPSILON) + 1)]
+            for k in {k for _, k in partners}:
+                for subset in combinations(tokens[:probe_prefix_length(threshold, size, k)], k):
+                    index[size, k, subset].append(mask)
+            probes.append((mask, tokens, partners))
+
+        for mask, tokens, partners in probes:
+            candidates = set()
+            for other_size, k in partners:
+                for subset in combinations(tokens[:probe_prefix_length(threshold, mask.bit_count(), k)], k):
+                    candidates.update(index.get((other_size, k, subset), ()))
+            for other in candidates:
+                if other < mask and reaches(mask, other, threshold):
+                    yield groups[other][0], groups[mask][0]
+
+    def _subset_size(self, size_x, size_y):
+        """Shared prefix tokens required of a pair; both sets must hold at least that many."""
+        return min(self.subset_size, _ceil(self.threshold * size_x), _ceil(self.threshold * size_y))
+
+    @staticmethod
+    def _shared_identity_pairs(users):
+        """Yield pairs of usernames that share a pgp_key or email."""
+        first_seen = {}
+        for username, pgp_key, email in users:
+            for key in (('pgp', pgp_key), ('email', email)):
+                if key[1]:
+                    if key in first_seen:
+                        yield first_seen[key], username
+                    else:
+                        first_seen[key] = username
+
+    # ---------------- Incremental Updates ----------------
+    def apply_pending(self):
+        """Link the users queued in alias_cluster_pending into the stored clusters."""
+        self.db_manager.flush()
+        reader = self.db_manager.reader()
+        state = reader.execute("SELECT value FROM alias_cluster_state WHERE name = 'threshold'").fetchone()
+        if state is None or state[0] != repr(self.threshold):
+            # Clusters are missing or were built for another threshold; only a rebuild,
+            # which also empties the queue, can fix them
+            return 0
+        self._split_requeued()
+        total, after = 0, ''
+        while True:
+            rows = reader.execute('''
+                SELECT p.username, p.seq, u.pgp_key, u.email
+                FROM alias_cluster_pending p JOIN users u ON u.username = p.username
+                WHERE p.username > ? ORDER BY p.username LIMIT ?
+            ''', (after, self.batch_size)).fetchall()
+            if not rows:
+                return total
+            after = rows[-1][0]
+            total += self._link_batch({username: (pgp_key, email) for username, _, pgp_key, email in rows},
+                                      [(username, seq) for username, seq, _, _ in rows])
+
+    def _split_requeued(self):
+        """
+        Queue every member of a cluster that holds a requeued user and drop
+        the cluster, so linking the members again rebuilds it from their
+        current identifiers.
+        """
+        touched = '''
+            SELECT c.cluster_id FROM user_clusters c JOIN alias_cluster_pending p ON p.username = c.username
+        '''
+        self.db_manager.execute_batches([
+            (f'''INSERT OR IGNORE INTO alias_cluster_pending (username, seq)
+                 SELECT username, (SELECT COALESCE(MAX(seq), 0) + 1 FROM alias_cluster_pending)
+                 FROM user_clusters WHERE cluster_id IN ({touched})''', [()]),
+            (f'DELETE FROM user_clusters WHERE cluster_id IN ({touched})', [()]),
+        ])
+
+    def _link_batch(self, batch, queued):
+        cursor = self.db_manager.reader().cursor()
+        order = dict(cursor.execute('SELECT token, rank FROM alias_token_order').fetchall())
+        new_tokens = []
+        for username in batch:
+            for token in sorted(set(username.lower()) - order.keys()):
+                # Unseen tokens go last, which keeps every existing prefix valid
+                order[token] = len(order)
+                new_tokens.append((token, order[token]))
+
+        clusters = UnionFind()
+        prefix_rows = []
+        for username, (pgp_key, email) in batch.items():
+            tokens = sorted(set(username.lower()), key=order.__getitem__)
+            size = len(tokens)
+            clusters.find(username)
+            if size:
+                prefix = tokens[:probe_prefix_length(self.threshold, size)]
+                prefix_rows.extend((token, username, size) for token in prefix)
+                cursor.execute(f'''
+                    SELECT DISTINCT username FROM alias_prefix_tokens
+                    WHERE token IN ({', '.join('?' * len(prefix))}) AND size BETWEEN ? AND ?
+                ''', [*prefix, _ceil(self.threshold * size), math.floor(size / self.threshold + _EPSILON)])
+                mask = char_mask(username, order)
+                for (other,) in cursor.fetchall():
+                    if other != username and reaches(mask, char_mask(other, order), self.threshold):
+                        clusters.union(username, other)
+            cursor.execute('SELECT username FROM users WHERE (pgp_key = ? OR email = ?) AND username != ?',
+                           (pgp_key, email, username))
+            for (other,) in cursor.fetchall():
+                clusters.union(username, other)
+
+        # Users in the same batch are not in the prefix index yet
+        batch_names = list(batch)
+        for a, b in self._similar_links(batch_names, order):
+            clusters.union(a, b)
+        for a, b in self._shared_identity_pairs([(name, *batch[name]) for name in batch_names]):
+            clusters.union(a, b)
+
+        # Fold in the clusters the touched users already belong to
+        members = list(clusters.parent)
+        existing = {}
+        for start in range(0, len(members), 500):
+            chunk = members[start:start + 500]
+            existing.update(cursor.execute(
+                f'SELECT username, cluster_id FROM user_clusters WHERE username IN ({", ".join("?" * len(chunk))})',
+                chunk
+            ).fetchall())
+        for username, cluster_id in existing.items():
+            clusters.union(username, cluster_id)
+
+        renamed = {cluster_id: clusters.find(cluster_id) for cluster_id in set(existing.values())}
+        self.db_manager.execute_batches([
+            ('INSERT INTO alias_token_order (token, rank) VALUES (?, ?)', new_tokens),
+            ('INSERT OR IGNORE INTO alias_prefix_tokens (token, username, size) VALUES (?, ?, ?)', prefix_rows),
+            ('UPDATE user_clusters SET cluster_id = ? WHERE cluster_id = ?',
+             [(new, old) for old, new in renamed.items() if new != old]),
+            ('INSERT OR REPLACE INTO user_clusters (username, cluster_id) VALUES (?, ?)',
+             [(username, clusters.find(username)) for username in batch]),
+            # A user requeued meanwhile has a new seq and stays queued
+            ('DELETE FROM alias_cluster_pending WHERE username = ? AND seq = ?', queued),
+        ])
+        return len(batch)
+
+    # ---------------- Lookups ----------------
+    def get_cluster(self, username):
+        """Return every username in the same identity group as `username`."""
+        self.apply_pending()
+        cursor = self.db_manager.reader().cursor()
+        cursor.execute('''
+            SELECT username FROM user_clusters
+            WHERE cluster_id = (SELECT cluster_id FROM user_clusters WHERE username = ?)
+            ORDER BY username
+        ''', (username,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_clusters(self, min_size=2):
+        """Return {cluster_id: [usernames]} for clusters with at least `min_size` members."""
+        self.apply_pending()
+        cursor = self.db_manager.reader().cursor()
+        cursor.execute('''
+            SELECT cluster_id, username FROM user_clusters
+            WHERE cluster_id IN (
+                SELECT cluster_id FROM user_clusters GROUP BY cluster_id HAVING COUNT(*) >= ?
+            )
+            ORDER BY cluster_id, username
+        ''', (min_size,))
+        clusters = defaultdict(list)
+        for cluster_id, username in cursor.fetchall():
+            clusters[cluster_id].append(username)
+        return dict(clusters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threshold', type=float, default=0.7, help="username similarity that links two users")
+    args = parser.parse_args()
+
+    db_manager = DataBaseManager()
+    try:
+        AliasClusterer(db_manager, threshold=args.threshold).rebuild()
+    finally:
+        db_manager.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,3 @@
-import json
 from datetime import datetime, timedelta
 
 class DataAnalyzer:
@@ -8,99 +7,57 @@ class DataAnalyzer:
     # ---------------- Website Analysis ----------------
     def analyze_websites(self):
         """Analyze website data for type, risk level, and temporal patterns"""
-        cursor = self.db_manager.conn.cursor()
-        
-        # Analyze by website type
-        cursor.execute('SELECT type, COUNT(*) FROM websites GROUP BY type')
-        website_types = dict(cursor.fetchall())
-        
-        # Analyze by risk levels
-        cursor.execute('SELECT risk_level, COUNT(*) FROM websites GROUP BY risk_level ORDER BY risk_level DESC')
-        risk_levels = dict(cursor.fetchall())
-        
+        counts = self.db_manager.get_report_counts
+
         # Temporal analysis for last 30 days
         thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
-        cursor.execute('''
-            SELECT substr(first_seen, 1, 10) as date, COUNT(*) 
-            FROM websites 
-            WHERE first_seen >= ? 
-            GROUP BY date 
-            ORDER BY date DESC
-        ''', (thirty_days_ago,))
-        temporal_patterns = dict(cursor.fetchall())
-        
+
         return {
-            'website_types': website_types,
-            'risk_levels': risk_levels,
-            'temporal_patterns': temporal_patterns
+            'website_types': counts('website_type', order_by='count'),
+            'risk_levels': counts('website_risk'),
+            'temporal_patterns': counts('website_first_seen', since=thirty_days_ago)
         }
 
     # ---------------- User Analysis ----------------
     def analyze_users(self):
         """Analyze user data for activity, risk, and marketplace distribution"""
-        cursor = self.db_manager.conn.cursor()
-        
-        # Activity per month (last 6 months)
-        cursor.execute('''
-            SELECT substr(last_active, 1, 7) as month, COUNT(*) 
-            FROM users 
-            GROUP BY month 
-            ORDER BY month DESC 
-            LIMIT 6
-        ''')
-        user_activity = dict(cursor.fetchall())
-        
-        # Users by risk level
-        cursor.execute('SELECT risk_level, COUNT(*) FROM users GROUP BY risk_level ORDER BY risk_level DESC')
-        user_risks = dict(cursor.fetchall())
-        
-        # Marketplace distribution
-        cursor.execute('SELECT marketplaces FROM users WHERE marketplaces IS NOT NULL')
-        marketplace_dist = {}
-        for row in cursor.fetchall():
-            try:
-                marketplaces = json.loads(row[0])
-                for m in marketplaces:
-                    marketplace_dist[m] = marketplace_dist.get(m, 0) + 1
-            except json.JSONDecodeError:
-                continue
-        
+        counts = self.db_manager.get_report_counts
+
         return {
-            'user_activity': user_activity,
-            'user_risks': user_risks,
-            'marketplace_distribution': marketplace_dist
+            # Activity per month (last 6 months)
+            'user_activity': counts('user_month', limit=6),
+            'user_risks': counts('user_risk'),
+            'marketplace_distribution': counts('user_marketplace', order_by='count')
         }
 
     # ---------------- Alert Analysis ----------------
     def analyze_alerts(self):
         """Analyze alerts by severity, type, and recent trends"""
-        cursor = self.db_manager.conn.cursor()
-        
-        # Alerts by severity
-        cursor.execute('SELECT severity, COUNT(*) FROM alerts GROUP BY severity ORDER BY severity DESC')
-        alert_severity = dict(cursor.fetchall())
-        
-        # Alerts by type
-        cursor.execute('SELECT type, COUNT(*) FROM alerts GROUP BY type ORDER BY COUNT(*) DESC')
-        alert_types = dict(cursor.fetchall())
-        
+        counts = self.db_manager.get_report_counts
+
         # Recent alerts (last 7 days)
         seven_days_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-        cursor.execute('''
-            SELECT substr(date_created, 1, 10) as date, COUNT(*) 
-            FROM alerts 
-            WHERE date_created >= ? 
-            GROUP BY date 
-            ORDER BY date DESC
-        ''', (seven_days_ago,))
-        recent_alerts = dict(cursor.fetchall())
-        
+
         return {
-            'alert_severity': alert_severity,
-            'alert_types': alert_types,
-            'recent_alerts': recent_alerts
+            'alert_severity': counts('alert_severity'),
+            'alert_types': counts('alert_type', order_by='count'),
+            'recent_alerts': counts('alert_date', since=seven_days_ago)
         }
 
+    # ---------------- Consistency Check ----------------
+    def verify_counters(self, repair=False):
+        """
+        Recount every report metric from the source tables and return the
+        buckets whose counters disagree. With `repair`, rebuild them.
+        """
+        mismatches = self.db_manager.verify_report_counters()
+        if mismatches:
+            print(f"[-] Report counters out of sync for: {', '.join(mismatches)}")
+            if repair:
+                self.db_manager.rebuild_report_counters()
+                print("[+] Report counters rebuilt")
+        return mismatches
+
     # ---------------- Generate Report ----------------
     def generate_report(self):
         """Generate a comprehensive analysis report"""
@@ -125,13 +82,13 @@ class DataAnalyzer:
         total_alerts = sum(alert_analysis.get('alert_severity', {}).values())
         
         high_risk_websites = sum(
-            website_analysis.get('risk_levels', {}).get(r, 0) for r in range(8, 10)
+            website_analysis.get('risk_levels', {}).get(r, 0) for r in range(8, 11)
         )
         high_risk_users = sum(
-            user_analysis.get('user_risks', {}).get(r, 0) for r in range(8, 10)
+            user_analysis.get('user_risks', {}).get(r, 0) for r in range(8, 11)
         )
         high_severity_alerts = sum(
-            alert_analysis.get('alert_severity', {}).get(r, 0) for r in range(8, 10)
+            alert_analysis.get('alert_severity', {}).get(r, 0) for r in range(8, 11)
         )
         
         most_common_website_type = max(
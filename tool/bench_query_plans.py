@@ -0,0 +1,122 @@
+"""
+Benchmark the hot lookup queries before and after the schema migrations.
+
+Builds a throwaway database from DATABASE_CONFIG, fills it with synthetic
+rows, then prints the query plan and timing of each hot query on the bare
+schema and again after DataBaseManager has applied its migrations.
+
+    python bench_query_plans.py --rows 1000000
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from config import DATABASE_CONFIG
+from database import DataBaseManager
+
+HOT_QUERIES = {
+    'search results by keyword': (
+        'SELECT * FROM search_results WHERE keyword = ? ORDER BY date_found DESC, relevance DESC LIMIT 50',
+        ('keyword7',)
+    ),
+    'latest search results': (
+        'SELECT * FROM search_results ORDER BY date_found DESC, relevance DESC LIMIT 50',
+        ()
+    ),
+    'alerts by severity': (
+        'SELECT * FROM alerts WHERE severity >= ? ORDER BY severity DESC, date_created DESC LIMIT 50',
+        (8,)
+    ),
+    'alerts by status and severity': (
+        'SELECT * FROM alerts WHERE severity >= ? AND status = ? '
+        'ORDER BY severity DESC, date_created DESC LIMIT 50',
+        (5, 'new')
+    ),
+    'websites first seen last 30 days': (
+        'SELECT substr(first_seen, 1, 10) as date, COUNT(*) FROM websites '
+        'WHERE first_seen >= ? GROUP BY date ORDER BY date DESC',
+        ((datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d"),)
+    ),
+    'alerts created last 7 days': (
+        'SELECT substr(date_created, 1, 10) as date, COUNT(*) FROM alerts '
+        'WHERE date_created >= ? GROUP BY date ORDER BY date DESC',
+        ((datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d"),)
+    ),
+    'website lookup by url': (
+        'SELECT first_seen FROM websites WHERE url = ?',
+        ('http://site123456.onion',)
+    ),
+}
+
+
+def random_date(days=365):
+    return (datetime.now() - timedelta(days=random.randint(0, days))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def populate(conn, rows, chunk_size=50000):
+    types = ['marketplace', 'forum', 'blog', 'chat', 'website']
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        conn.executemany(
+            'INSERT INTO websites (url, title, content, type, first_seen, last_seen, geo_location, risk_level) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(f'http://site{i}.onion', 'title', 'content', random.choice(types), random_date()[:10],
+              random_date()[:10], 'Unknown', random.randint(0, 10)) for i in range(start, start + count)]
+        )
+        conn.executemany(
+            'INSERT INTO search_results (keyword, url, title, snippet, relevance, date_found) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'keyword{random.randint(0, 999)}', f'http://site{i}.onion', 'title', 'snippet',
+              random.randint(0, 100), random_date()[:10]) for i in range(start, start + count)]
+        )
+        conn.executemany(
+            'INSERT INTO alerts (type, content, severity, date_created, status) VALUES (?, ?, ?, ?, ?)',
+            [('Suspicious content detected', 'content', random.randint(1, 10), random_date(),
+              random.choice(['new', 'reviewed', 'closed'])) for _ in range(count)]
+        )
+        conn.commit()
+
+
+def run_queries(conn, label, repeat=5):
+    print(f"\n=== {label} ===")
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+        print(f"{name:<36} {elapsed:>10.2f} ms  | {'; '.join(plan)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1000000, help="rows per table")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        for table_sql in DATABASE_CONFIG['tables'].values():
+            conn.execute(table_sql)
+        print(f"[+] Populating {args.rows} rows per table in {path}")
+        populate(conn, args.rows)
+        conn.execute('ANALYZE')
+        run_queries(conn, "bare schema")
+        conn.close()
+
+        db_manager = DataBaseManager(path)
+        db_manager.conn.execute('ANALYZE')
+        run_queries(db_manager.conn, f"schema version {db_manager.schema_version()}")
+        db_manager.close()
+    finally:
+        os.remove(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
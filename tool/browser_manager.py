@@ -1,22 +1,365 @@
+import os
+import re
+import socket
+import tempfile
+import threading
 import subprocess
 import time
 import requests
+from contextlib import contextmanager
+from proxy_health import ProxyHealthMonitor, tor_target
 
 BROWSER_CONFIG = {
     'tor': {
         'command': r"C:\Users\NIHAL\Downloads\tor-expert-bundle-windows-x86_64-14.5.6\tor\tor.exe",
         'check_cmd': r"C:\Users\NIHAL\Downloads\tor-expert-bundle-windows-x86_64-14.5.6\tor\tor.exe --version",
-        'socks_port': 9050
+        'socks_port': 9050,
+        # Pool mode: instance i listens on socks_port + 2 * i and control_port + 2 * i
+        'control_port': 9051,
+        'data_directory': os.path.join(tempfile.gettempdir(), 'tor_pool'),
+        'pool_size': 1,
+        'pool_strategy': 'round_robin',     # or 'least_load'
+        'health_interval': 60,
+        'max_failures': 3,
+        'bootstrap_timeout': 300,
+        'attach_existing': True     # reuse a Tor already listening on the configured ports
     }
 }
 
+BOOTSTRAP_RE = re.compile(r'Bootstrapped (\d+)%')
+PROGRESS_RE = re.compile(r'PROGRESS=(\d+)')
+COOKIE_FILE_RE = re.compile(r'COOKIEFILE="((?:[^"\\]|\\.)*)"')
+
+
+def _proxy_dict(port):
+    return {
+        'http': f"socks5h://127.0.0.1:{port}",
+        'https': f"socks5h://127.0.0.1:{port}"
+    }
+
+
+def port_open(port, host='127.0.0.1', timeout=2):
+    """Return True if something accepts TCP connections on host:port."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def tor_control_status(port, host='127.0.0.1', timeout=2):
+    """
+    Probe a Tor control port. Returns None when no Tor answers there, else
+    the bootstrap percentage, or -1 when Tor answered but would not report
+    it (the port needs a password).
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            stream = sock.makefile('rwb')
+
+            def command(line):
+                stream.write(line.encode() + b'\r\n')
+                stream.flush()
+                reply = []
+                while True:
+                    response = stream.readline().decode(errors='replace').rstrip('\r\n')
+                    if not response:
+                        return reply
+                    reply.append(response)
+                    if response[3:4] == ' ':
+                        return reply
+
+            info = command('PROTOCOLINFO 1')
+            if not info or not info[0].startswith('250-PROTOCOLINFO'):
+                return None
+            methods = ' '.join(info)
+            if 'NULL' in methods:
+                auth = 'AUTHENTICATE'
+            else:
+                cookie = COOKIE_FILE_RE.search(methods)
+                if 'COOKIE' not in methods or not cookie:
+                    return -1
+                try:
+                    with open(cookie.group(1).replace('\\"', '"').replace('\\\\', '\\'), 'rb') as f:
+                        auth = f'AUTHENTICATE {f.read().hex()}'
+                except OSError:
+                    return -1
+            if command(auth)[-1:] != ['250 OK']:
+                return -1
+            progress = PROGRESS_RE.search(' '.join(command('GETINFO status/bootstrap-phase')))
+            return int(progress.group(1)) if progress else -1
+    except (OSError, UnicodeError):
+        return None
+
+
+class TorBootstrap:
+    """
+    Follows a Tor process's log on a background thread, so waiting for the
+    bootstrap has a real deadline and the pipe keeps being drained after it.
+    `progress(percent, line)` is called from that thread on every new
+    bootstrap percentage.
+    """
+
+    def __init__(self, process, progress=None):
+        self.process = process
+        self.progress = progress
+        self.percent = 0
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._follow, name='tor-log', daemon=True)
+        self.thread.start()
+
+    def _follow(self):
+        try:
+            for line in self.process.stdout:
+                match = BOOTSTRAP_RE.search(line)
+                if match and int(match.group(1)) > self.percent:
+                    self.percent = int(match.group(1))
+                    if self.progress:
+                        self.progress(self.percent, line.strip())
+                    if self.percent >= 100:
+                        self.done.set()
+        except (OSError, ValueError):
+            pass
+        # The log ended, so the process exited; waiters need not sit out the deadline
+        self.done.set()
+
+    def wait(self, timeout):
+        """Return True once Tor is fully bootstrapped, False on exit or after `timeout` seconds."""
+        self.done.wait(timeout)
+        return self.percent >= 100
+
+
+def print_progress(percent, line):
+    print(f"[Tor] Bootstrapped {percent}%")
+
+
+class TorInstance:
+    """One Tor process of a pool, with its own ports, data directory and circuits."""
+
+    def __init__(self, index, socks_port, control_port, data_directory):
+        self.index = index
+        self.socks_port = socks_port
+        self.control_port = control_port
+        self.data_directory = data_directory
+        self.process = None
+        self.attached = False       # reusing a Tor started elsewhere, which stop() leaves running
+        self.healthy = False
+        self.in_flight = 0          # requests currently using this instance
+        self.assigned = 0           # proxy settings handed out and not released
+        self.failures = 0           # consecutive failed requests
+
+    @property
+    def load(self):
+        return self.in_flight + self.assigned
+
+    def proxies(self):
+        return _proxy_dict(self.socks_port)
+
+    def start(self, command):
+        if port_open(self.socks_port) and tor_control_status(self.control_port) is not None:
+            print(f"[+] Tor instance {self.index} attached to the Tor already on port {self.socks_port}")
+            self.attached = True
+            return
+        os.makedirs(self.data_directory, exist_ok=True)
+        cmd = command.split() + [
+            '--SocksPort', str(self.socks_port),
+            '--ControlPort', str(self.control_port),
+            '--DataDirectory', self.data_directory
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    def check(self):
+        """Healthy while the process runs and its SOCKS port accepts connections."""
+        alive = self.attached or (self.process is not None and self.process.poll() is None)
+        self.healthy = alive and port_open(self.socks_port)
+        if self.healthy:
+            self.failures = 0
+        return self.healthy
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        self.healthy = False
+
+
+class TorPool:
+    """
+    N Tor instances on separate ports and data directories. Proxy settings
+    are handed out round-robin or to the least-loaded healthy instance, so
+    parallel crawl and search workers spread over independent circuits.
+    """
+
+    STRATEGIES = ('round_robin', 'least_load')
+
+    def __init__(self, size, command=None, socks_port=None, control_port=None, data_directory=None,
+                 strategy=None, health_interval=None, max_failures=None, monitor=None):
+        tor_config = BROWSER_CONFIG['tor']
+        self.command = command or tor_config['command']
+        self.strategy = strategy or tor_config.get('pool_strategy', 'round_robin')
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown pool strategy '{self.strategy}'")
+        self.health_interval = health_interval or tor_config.get('health_interval', 60)
+        self.max_failures = max_failures or tor_config.get('max_failures', 3)
+        socks_port = socks_port or tor_config['socks_port']
+        control_port = control_port or tor_config.get('control_port', socks_port + 1)
+        data_directory = data_directory or tor_config.get('data_directory',
+                                                          os.path.join(tempfile.gettempdir(), 'tor_pool'))
+        self.instances = [
+            TorInstance(i, socks_port + 2 * i, control_port + 2 * i, os.path.join(data_directory, str(i)))
+            for i in range(size)
+        ]
+        self.monitor = monitor      # a ProxyHealthMonitor whose demotions steer selection
+        self.lock = threading.Lock()
+        self._next = 0
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    # ---------------- Lifecycle ----------------
+    def start(self, timeout=None, progress=None):
+        """
+        Start every instance, or attach to a Tor already on its ports, and
+        wait for them to bootstrap in parallel under one deadline of
+        `timeout` seconds. `progress(index, percent, line)` reports each
+        instance's progress. Instances that fail stay out of rotation.
+        Returns the number of healthy instances.
+        """
+        timeout = timeout or BROWSER_CONFIG['tor'].get('bootstrap_timeout', 300)
+        bootstraps = {}
+        for instance in self.instances:
+            instance.start(self.command)
+            if instance.process:
+                report = (lambda percent, line, index=instance.index: progress(index, percent, line)) \
+                    if progress else None
+                bootstraps[instance.index] = TorBootstrap(instance.process, report)
+        deadline = time.monotonic() + timeout
+        for instance in self.instances:
+            bootstrap = bootstraps.get(instance.index)
+            if bootstrap is None or bootstrap.wait(max(0, deadline - time.monotonic())):
+                instance.check()
+            else:
+                print(f"[-] Tor instance {instance.index} did not bootstrap in time")
+        if self.monitor:
+            for instance in self.instances:
+                self.monitor.register(tor_target(instance.socks_port), instance.proxies())
+        healthy = sum(instance.healthy for instance in self.instances)
+        print(f"[+] Tor pool running {healthy}/{len(self.instances)} instances")
+        if healthy:
+            self._stop.clear()
+            self._health_thread = threading.Thread(target=self._health_loop, name='tor-pool-health', daemon=True)
+            self._health_thread.start()
+        return healthy
+
+    def stop(self):
+        self._stop.set()
+        if self._health_thread:
+            self._health_thread.join()
+            self._health_thread = None
+        for instance in self.instances:
+            instance.stop()
+
+    def check_health(self):
+        """Re-check every instance; returns the number of healthy ones."""
+        healthy = 0
+        for instance in self.instances:
+            was_healthy = instance.healthy
+            if instance.check():
+                healthy += 1
+                if not was_healthy:
+                    print(f"[+] Tor instance {instance.index} back in rotation")
+            elif was_healthy:
+                print(f"[-] Tor instance {instance.index} failed its health check")
+        return healthy
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    # ---------------- Selection ----------------
+    def _select(self, strategy=None):
+        # Caller holds self.lock
+        healthy = [instance for instance in self.instances if instance.healthy]
+        if not healthy:
+            return None
+        if self.monitor:
+            # Slow or failing exits are skipped while any other instance is fine
+            preferred = [instance for instance in healthy
+                         if not self.monitor.is_demoted(tor_target(instance.socks_port))]
+            healthy = preferred or healthy
+        if (strategy or self.strategy) == 'least_load':
+            return min(healthy, key=lambda instance: (instance.load, instance.index))
+        instance = healthy[self._next % len(healthy)]
+        self._next += 1
+        return instance
+
+    def get_proxy_settings(self, strategy=None):
+        """
+        Assign an instance to a long-lived worker. The assignment counts
+        towards the instance's load until it is given back with release().
+        """
+        with self.lock:
+            instance = self._select(strategy)
+            if instance is None:
+                return None
+            instance.assigned += 1
+            return instance.proxies()
+
+    def release(self, proxy_settings):
+        with self.lock:
+            for instance in self.instances:
+                if instance.proxies() == proxy_settings and instance.assigned:
+                    instance.assigned -= 1
+                    return
+
+    @contextmanager
+    def lease(self, strategy=None):
+        """
+        Proxy settings for a single request. A request that raises counts as
+        a failure, and an instance failing `max_failures` times in a row is
+        taken out of rotation until the next health check passes.
+        """
+        with self.lock:
+            instance = self._select(strategy)
+            if instance is None:
+                raise ConnectionError("No healthy Tor instance in the pool")
+            instance.in_flight += 1
+        succeeded = False
+        try:
+            yield instance.proxies()
+            succeeded = True
+        except Exception:
+            with self.lock:
+                instance.failures += 1
+                if instance.failures >= self.max_failures and instance.healthy:
+                    instance.healthy = False
+                    print(f"[-] Tor instance {instance.index} taken out of rotation after "
+                          f"{instance.failures} failed requests")
+            raise
+        finally:
+            with self.lock:
+                instance.in_flight -= 1
+                if succeeded:
+                    instance.failures = 0
+
+
 class BrowserManager:
     def __init__(self):
         self.current_browser = None
         self.process = None
         self.socks_port = None
+        self.pool = None
+        self.bootstrap = None
+        self.health = ProxyHealthMonitor()
 
-    def connect(self, browser_type):
+    def connect(self, browser_type, pool_size=None, timeout=None, progress=print_progress):
+        """
+        Start and verify the browser. For Tor, a Tor already listening on
+        the configured ports is reused; otherwise one is started and given
+        `timeout` seconds to bootstrap, reporting `progress(percent, line)`.
+        A `pool_size` (or the configured 'pool_size') above 1 starts a
+        TorPool instead of one process.
+        """
         browser_type = browser_type.lower()
         if browser_type not in BROWSER_CONFIG:
             print(f"[-] Unsupported browser: {browser_type}")
@@ -26,6 +369,12 @@ class BrowserManager:
         print(f"[+] Connecting to {browser_type.upper()}...")
 
         try:
+            pool_size = pool_size or browser_config.get('pool_size', 1)
+            if browser_type == 'tor' and pool_size <= 1 and browser_config.get('attach_existing', True):
+                attached = self._attach_running_tor(browser_config, timeout, progress)
+                if attached is not None:
+                    return attached
+
             # Check if Tor exists
             check_cmd = browser_config['check_cmd'].split()
             result = subprocess.run(check_cmd, capture_output=True, text=True, timeout=10)
@@ -33,14 +382,19 @@ class BrowserManager:
                 print(f"[-] {browser_type.upper()} is not installed or not in PATH")
                 return False
 
+            if browser_type == 'tor' and pool_size > 1:
+                return self._connect_pool(browser_config, pool_size, timeout, progress)
+
             # Start Tor process and capture stdout
             cmd = browser_config['command'].split()
             self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
 
             # Wait for Tor to fully bootstrap
             if browser_type == 'tor':
-                if not self.wait_for_tor_bootstrap():
+                if not self.wait_for_tor_bootstrap(timeout, progress=progress):
                     print("[-] Tor did not bootstrap in time")
+                    self.process.terminate()
+                    self.process = None
                     return False
                 self.socks_port = browser_config['socks_port']
 
@@ -57,32 +411,78 @@ class BrowserManager:
             print(f"[-] Error connecting to {browser_type.upper()}: {str(e)}")
             return False
 
-    def wait_for_tor_bootstrap(self, timeout=300):
-        """Wait until Tor reports 100% bootstrapped."""
-        start_time = time.time()
-        print("[*] Waiting for Tor to bootstrap...")
-        while True:
-            if time.time() - start_time > timeout:
+    def _attach_running_tor(self, browser_config, timeout=None, progress=None):
+        """
+        Reuse a Tor already listening on the configured SOCKS and control
+        ports. Returns None when there is none, else whether attaching
+        succeeded. A Tor that is still bootstrapping is polled over its
+        control port until done or the deadline passes.
+        """
+        socks_port = browser_config['socks_port']
+        if not port_open(socks_port):
+            return None
+        control_port = browser_config.get('control_port', socks_port + 1)
+        status = tor_control_status(control_port)
+        print(f"[+] Found a running Tor on SOCKS port {socks_port}, attaching")
+        deadline = time.monotonic() + (timeout or browser_config.get('bootstrap_timeout', 300))
+        reported = 0
+        while status is not None and 0 <= status < 100:
+            if status > reported and progress:
+                progress(status, f"Bootstrapped {status}% (control port {control_port})")
+                reported = status
+            if time.monotonic() >= deadline:
+                print("[-] Running Tor did not bootstrap in time")
                 return False
-            line = self.process.stdout.readline()
-            if not line:
-                time.sleep(1)
-                continue
-            line = line.strip()
-            print("[Tor]", line)  # Optional: show Tor logs
-            if "Bootstrapped 100%" in line:
-                return True
+            time.sleep(1)
+            status = tor_control_status(control_port)
+
+        self.socks_port = socks_port
+        if not self.verify_connection('tor'):
+            print(f"[-] Port {socks_port} is in use but does not proxy through Tor")
+            self.socks_port = None
+            return False
+        self.current_browser = 'tor'
+        print("[+] Connected to TOR successfully (existing instance)")
+        return True
+
+    def _connect_pool(self, browser_config, pool_size, timeout=None, progress=None):
+        self.pool = TorPool(pool_size, command=browser_config['command'], monitor=self.health)
+        report = (lambda index, percent, line: progress(percent, f"[{index}] {line}")) if progress else None
+        if not self.pool.start(timeout, report):
+            print("[-] No Tor instance in the pool bootstrapped")
+            self.pool.stop()
+            self.pool = None
+            return False
+        self.socks_port = next(instance.socks_port for instance in self.pool.instances if instance.healthy)
+        if not self.verify_connection('tor'):
+            print("[-] Failed to verify TOR pool connection")
+            return False
+        self.current_browser = 'tor'
+        print(f"[+] Connected to TOR pool with {pool_size} instances")
+        return True
+
+    def wait_for_tor_bootstrap(self, timeout=None, process=None, progress=print_progress):
+        """
+        Wait until Tor reports 100% bootstrapped, at most `timeout` seconds.
+        The log is read on a background thread, so the deadline holds even
+        while Tor is silent, and the thread keeps draining it afterwards.
+        """
+        timeout = timeout or BROWSER_CONFIG['tor'].get('bootstrap_timeout', 300)
+        print("[*] Waiting for Tor to bootstrap...")
+        self.bootstrap = TorBootstrap(process or self.process, progress)
+        return self.bootstrap.wait(timeout)
 
     def verify_connection(self, browser_type):
         """Check if Tor proxy is working by fetching external IP."""
         try:
             session = requests.session()
             if browser_type == 'tor':
-                session.proxies = {
-                    'http': f"socks5h://127.0.0.1:{self.socks_port}",
-                    'https': f"socks5h://127.0.0.1:{self.socks_port}"
-                }
-                response = session.get("https://httpbin.org/ip", timeout=10)
+                session.proxies = _proxy_dict(self.socks_port)
+                # The check doubles as the exit's first latency sample
+                target = tor_target(self.socks_port)
+                self.health.register(target, session.proxies)
+                with self.health.timed(target) as sample:
+                    response = sample['response'] = session.get("https://httpbin.org/ip", timeout=10)
                 if response.status_code == 200:
                     print(f"[Tor] External IP via Tor: {response.text}")
                     return True
@@ -92,21 +492,51 @@ class BrowserManager:
             return False
 
 
-    def get_proxy_settings(self):
-        """Get the current proxy settings for the connected browser."""
+    def probe_exits(self, rounds=3, url="https://httpbin.org/ip"):
+        """
+        Time `rounds` requests through every Tor exit, feeding the health
+        monitor, and return its report of latency, error rate and throughput.
+        """
+        for _ in range(rounds):
+            for target in list(self.health.targets):
+                if target.startswith('tor:'):
+                    self.health.probe(target, url)
+        return self.health.report()
+
+    def get_proxy_settings(self, strategy=None):
+        """
+        Get the current proxy settings for the connected browser. In pool
+        mode every call assigns the next instance by `strategy`
+        ('round_robin' or 'least_load', default from the config); give
+        settings back with release_proxy_settings() when a worker finishes.
+        """
         if not self.current_browser:
             return None
 
         if self.current_browser == 'tor':
-            return {
-                'http': f"socks5h://127.0.0.1:{self.socks_port}",
-                'https': f"socks5h://127.0.0.1:{self.socks_port}"
-            }
+            if self.pool:
+                return self.pool.get_proxy_settings(strategy)
+            return _proxy_dict(self.socks_port)
         # Add more browsers if needed
         return None
 
+    def release_proxy_settings(self, proxy_settings):
+        if self.pool:
+            self.pool.release(proxy_settings)
+
 
     def disconnect(self):
+        if self.current_browser and not self.process and not self.pool:
+            # Attached to a Tor started elsewhere; leave it running
+            self.current_browser = None
+            self.socks_port = None
+            print("[+] Detached from running Tor")
+        if self.pool:
+            self.pool.stop()
+            self.pool = None
+            self.current_browser = None
+            self.socks_port = None
+            print("[+] Tor pool disconnected")
         if self.process:
             self.process.terminate()
             self.process.wait()
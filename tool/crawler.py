@@ -1,20 +1,120 @@
 import time
+import asyncio
+import threading
+import hashlib
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from config import SEARCH_CONFIG
+from frontier import BloomFilter, CrawlFrontier
+from page_parser import parse_page
+from proxy_health import vpn_target
 
 class DarkWebCrawler:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, concurrency=None, parse_workers=None):
         self.db_manager = db_manager
         self.proxy_settings = None
+        self.proxy_pool = None
+        self.vpn = None
+        self.health = None
+        self._vpn_generation = None
+        self._session_lock = threading.Lock()
         self.visited_urls = set()
+        self.concurrency = concurrency or SEARCH_CONFIG.get('crawl_concurrency', 8)
+        self.crawl_delay = SEARCH_CONFIG.get('crawl_delay', 1)
+        self.host_concurrency = SEARCH_CONFIG.get('host_concurrency', 2)
+        self.checkpoint_interval = SEARCH_CONFIG.get('checkpoint_interval', 25)
+        self.parse_workers = parse_workers if parse_workers is not None else SEARCH_CONFIG.get('parse_workers', 0)
+        self.parse_queue_size = SEARCH_CONFIG.get('parse_queue_size', 2 * self.concurrency)
+        self.session = None
+        self._session_users = {}        # session -> fetches using it; a replaced session closes when idle
+        self.risk_batch_size = SEARCH_CONFIG.get('risk_batch_size', 64)
+        self._unscored = []
+        self._pending_queued = []
+        self._pending_visited = []
+        self.incremental = False
+        self.persist = True
+        self.unchanged_count = 0
 
     def set_proxy(self, proxy_settings):
         self.proxy_settings = proxy_settings
+        self.proxy_pool = None
+        self.close()  # pooled connections belong to the old proxy
 
-    def crawl(self, urls=None, depth=1, max_pages=50):
-        if not self.proxy_settings:
+    def set_proxy_pool(self, pool):
+        """Spread fetches over a browser_manager.TorPool, leasing an instance per request."""
+        self.proxy_pool = pool
+        self.proxy_settings = None
+        self.close()
+
+    def set_vpn(self, vpn_manager):
+        """
+        Send fetches through a vpn_manager.VPNManager's traffic gate, so a
+        tunnel rotation drains them first and holds new ones until the next
+        tunnel is up.
+        """
+        self.vpn = vpn_manager
+
+    def set_health_monitor(self, monitor):
+        """
+        Record every fetch's latency and outcome in a proxy_health.ProxyHealthMonitor,
+        and move off the set_proxy target as soon as the monitor demotes it.
+        """
+        self.health = monitor
+
+    def close(self):
+        """Close the shared session and its pooled connections, once fetches still using it finish."""
+        with self._session_lock:
+            self._retire_session()
+
+    def _retire_session(self):
+        # Caller holds self._session_lock
+        session, self.session = self.session, None
+        if session is not None and not self._session_users.get(session):
+            session.close()
+
+    @contextmanager
+    def _use_session(self):
+        """Lease the keep-alive session shared by every fetch of the crawl."""
+        with self._session_lock:
+            if self.vpn and self._vpn_generation != self.vpn.generation:
+                # Keep-alive connections were opened through the previous tunnel
+                self._retire_session()
+                self._vpn_generation = self.vpn.generation
+            if self.session is None:
+                self.session = self._new_session()
+            session = self.session
+            self._session_users[session] = self._session_users.get(session, 0) + 1
+        try:
+            yield session
+        finally:
+            with self._session_lock:
+                self._session_users[session] -= 1
+                if not self._session_users[session]:
+                    del self._session_users[session]
+                    if session is not self.session:
+                        session.close()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if self.proxy_settings:
+            session.proxies = self.proxy_settings
+        return session
+
+    def crawl(self, urls=None, depth=1, max_pages=50, resume=True, incremental=False, persist=True):
+        """
+        Crawl the given seeds. Progress is checkpointed to the database, and
+        when `resume` is set an interrupted crawl continues where it stopped.
+        With `incremental`, pages are fetched conditionally and unchanged pages
+        only have their last_seen date bumped. Without `persist`, the crawl
+        neither checkpoints its progress nor touches the saved crawl state,
+        so an interrupted crawl can still be resumed afterwards.
+        """
+        if not self.proxy_settings and not self.proxy_pool:
             print("[-] No proxy settings configured. Connect to Tor first.")
             return []
 
@@ -22,89 +122,401 @@ class DarkWebCrawler:
         if not urls:
             urls = ["http://directory123.onion", "http://darkwebwiki.i2p", "http://freenetproject.org"]
 
-        crawled_data = []
+        self.incremental = incremental
+        self.persist = persist
+        self.unchanged_count = 0
+        frontier, pages_per_seed = self._open_frontier(resume and persist)
         for url in urls:
             print(f"[+] Crawling: {url}")
-            site_data = self._crawl_site(url, depth, max_pages)
-            crawled_data.extend(site_data)
+            self._queue(frontier, url, 0, url)
 
-            for page in site_data:
-                self.db_manager.store_website(
-                    page['url'], page['title'], page['content'],
-                    page['type'], page['geo_location'], page.get('risk_level', 0)
-                )
+        executor = ThreadPoolExecutor(max_workers=self.concurrency) if self.concurrency > 1 else None
+        # Parsing is CPU-bound, so the pipeline mode moves it off the GIL into worker processes
+        parse_executor = ProcessPoolExecutor(max_workers=self.parse_workers) if executor and self.parse_workers else None
+        try:
+            if executor:
+                crawled_data = asyncio.run(self._crawl_frontier_async(
+                    frontier, depth, max_pages, pages_per_seed, executor, parse_executor
+                ))
+            else:
+                crawled_data = self._crawl_frontier(frontier, depth, max_pages, pages_per_seed)
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+            if parse_executor:
+                parse_executor.shutdown(wait=True)
+            self._checkpoint()
 
+        # Only a fully drained frontier means the crawl is finished
+        if persist and not len(frontier):
+            self.db_manager.clear_crawl_state()
+
+        if incremental:
+            print(f"[+] {self.unchanged_count} pages unchanged since the last crawl")
         print(f"[+] Crawl completed. Found {len(crawled_data)} items.")
         return crawled_data
 
-    def _crawl_site(self, base_url, depth, max_pages):
-        to_crawl = [(base_url, 0)]
+    def recrawl(self, urls=None, depth=0, max_pages=50):
+        """
+        Incrementally re-check known pages, defaulting to every stored URL.
+        The saved state of an interrupted crawl is left alone.
+        """
+        urls = urls or self.db_manager.get_all_urls()
+        if not urls:
+            print("[-] No known pages to recrawl")
+            return []
+        return self.crawl(urls, depth=depth, max_pages=max_pages, resume=False, incremental=True, persist=False)
+
+    # ---------------- Frontier Persistence ----------------
+    def _open_frontier(self, resume):
+        """Build the frontier, reloading persisted crawl state when resuming."""
+        seen = BloomFilter(
+            capacity=SEARCH_CONFIG.get('bloom_capacity', 1000000),
+            error_rate=SEARCH_CONFIG.get('bloom_error_rate', 0.001)
+        )
+        # All seeds share one frontier so slow hidden services only hold up their own queue
+        frontier = CrawlFrontier(host_delay=self.crawl_delay, host_concurrency=self.host_concurrency, seen=seen)
+        self.visited_urls = seen
+        self._pending_queued = []
+        self._pending_visited = []
+
+        queued = self.db_manager.get_crawl_frontier() if resume else []
+        if not queued:
+            if self.persist:
+                self.db_manager.clear_crawl_state()
+            return frontier, {}
+
+        print(f"[+] Resuming crawl with {len(queued)} queued URLs")
+        for url in self.db_manager.iter_crawl_visited():
+            frontier.mark_seen(url)
+        for url, depth, seed in queued:
+            frontier.add(url, depth, seed=seed)
+        return frontier, self.db_manager.get_crawl_page_counts()
+
+    def _queue(self, frontier, url, depth, seed):
+        if frontier.add(url, depth, seed=seed):
+            self._pending_queued.append((url, depth, seed))
+
+    def _finish(self, frontier, url, seed, status):
+        frontier.done(url)
+        self._pending_visited.append((url, seed, status))
+        if len(self._pending_visited) >= self.checkpoint_interval:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        # Pages must be stored before their URLs are checkpointed as visited
+        self._store_scored()
+        if not self.persist:
+            self._pending_queued = []
+            self._pending_visited = []
+            return
+        if not self._pending_queued and not self._pending_visited:
+            return
+        if self.db_manager.checkpoint_crawl(self._pending_queued, self._pending_visited):
+            self._pending_queued = []
+            self._pending_visited = []
+
+    # ---------------- Crawl Loops ----------------
+    def _crawl_frontier(self, frontier, depth, max_pages, pages_per_seed):
+        """Crawl sequentially, waiting only when every queued host is still cooling down."""
         crawled_data = []
-        self.visited_urls.clear()
 
-        while to_crawl and len(crawled_data) < max_pages:
-            url, current_depth = to_crawl.pop(0)
-            if url in self.visited_urls or current_depth > depth:
+        while True:
+            entry, wait = frontier.next()
+            if entry is None:
+                if wait is None:
+                    break
+                time.sleep(wait)
                 continue
 
+            url, current_depth, seed = entry
+            if pages_per_seed.get(seed, 0) >= max_pages:
+                self._finish(frontier, url, seed, 'skipped')
+                continue
+
+            status = 'error'
             try:
-                page_data = self._fetch_page(url)
+                page_data = self._fetch_page(url, self._get_fingerprint(url))
                 if page_data:
-                    crawled_data.append(page_data)
-                    self.visited_urls.add(url)
+                    pages_per_seed[seed] = pages_per_seed.get(seed, 0) + 1
+                    status = self._handle_page(frontier, page_data, seed, current_depth, depth, crawled_data)
+            except Exception as e:
+                print(f"[-] Error crawling {url}: {str(e)}")
+            # Not reached on interrupts, so an aborted fetch stays queued for resume
+            self._finish(frontier, url, seed, status)
+
+        return crawled_data
+
+    async def _crawl_frontier_async(self, frontier, depth, max_pages, pages_per_seed, executor,
+                                    parse_executor=None):
+        """Crawl with at most `self.concurrency` fetches in flight.
 
-                    if current_depth < depth:
-                        links = self._extract_links(page_data['content'], base_url)
-                        for link in links:
-                            if link not in self.visited_urls:
-                                to_crawl.append((link, current_depth + 1))
+        Blocking fetches run on `executor` against the shared keep-alive session,
+        so the event loop only schedules hosts and expands links. With a
+        `parse_executor`, fetch workers hand raw bodies to a bounded queue that
+        feeds a process-pool parse stage; a full queue pauses the fetchers.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Condition()
+        parse_queue = asyncio.Queue(maxsize=self.parse_queue_size) if parse_executor else None
+        crawled_data = []
+        in_flight = 0
 
-                time.sleep(1)  # polite delay
+        async def complete(entry, page_data):
+            nonlocal in_flight
+            url, current_depth, seed = entry
+            status = 'error'
+            try:
+                if page_data:
+                    status = self._handle_page(frontier, page_data, seed, current_depth, depth, crawled_data)
             except Exception as e:
                 print(f"[-] Error crawling {url}: {str(e)}")
-                continue
+            finally:
+                if status == 'error':
+                    pages_per_seed[seed] -= 1
+                in_flight -= 1
+            self._finish(frontier, url, seed, status)
+            async with wakeup:
+                wakeup.notify_all()
+
+        async def fetcher():
+            nonlocal in_flight
+            while True:
+                async with wakeup:
+                    while True:
+                        entry, wait = frontier.next()
+                        if entry is not None:
+                            break
+                        if wait is None and in_flight == 0:
+                            wakeup.notify_all()
+                            return
+                        try:
+                            await asyncio.wait_for(wakeup.wait(), wait)
+                        except asyncio.TimeoutError:
+                            pass
+
+                url, current_depth, seed = entry
+                if pages_per_seed.get(seed, 0) >= max_pages:
+                    self._finish(frontier, url, seed, 'skipped')
+                    continue
+
+                # Reserve the page up front so concurrent workers never overshoot max_pages
+                pages_per_seed[seed] = pages_per_seed.get(seed, 0) + 1
+                in_flight += 1
+                page_data = None
+                try:
+                    fingerprint = self._get_fingerprint(url)
+                    if parse_queue is None:
+                        page_data = await loop.run_in_executor(executor, self._fetch_page, url, fingerprint)
+                    else:
+                        page_data = await loop.run_in_executor(executor, self._fetch_raw, url, fingerprint)
+                        if page_data and not page_data.get('unchanged'):
+                            await parse_queue.put((entry, page_data))
+                            continue  # the parse stage completes this entry
+                except Exception as e:
+                    print(f"[-] Error crawling {url}: {str(e)}")
+                await complete(entry, page_data)
 
+        async def parser():
+            while True:
+                entry, raw = await parse_queue.get()
+                page_data = None
+                try:
+                    parsed = await loop.run_in_executor(parse_executor, parse_page, raw['body'], raw['url'])
+                    page_data = self._build_page_data(raw['url'], parsed, raw)
+                except Exception as e:
+                    print(f"[-] Error parsing {raw['url']}: {str(e)}")
+                await complete(entry, page_data)
+                parse_queue.task_done()
+
+        parsers = []
+        if parse_queue is not None:
+            parsers = [asyncio.create_task(parser()) for _ in range(self.parse_workers)]
+        try:
+            await asyncio.gather(*(fetcher() for _ in range(self.concurrency)))
+        finally:
+            for task in parsers:
+                task.cancel()
+            await asyncio.gather(*parsers, return_exceptions=True)
         return crawled_data
 
-    def _fetch_page(self, url):
+    def _handle_page(self, frontier, page_data, seed, current_depth, depth, crawled_data):
+        """Store a fetched page and queue its links. Returns the visit status."""
+        if page_data.get('unchanged'):
+            # Nothing to store or alert on, but the links stored with its fingerprint still lead on
+            self.unchanged_count += 1
+            self.db_manager.touch_website(page_data['url'], defer=True)
+            self._enqueue_links(frontier, page_data, seed, current_depth, depth)
+            return 'unchanged'
+
+        crawled_data.append(page_data)
+        self._store_page(page_data)
+        self._enqueue_links(frontier, page_data, seed, current_depth, depth)
+        return 'ok'
+
+    def _store_page(self, page):
+        # Pages are risk-scored in batches, and stored once scored
+        self._unscored.append(page)
+        if len(self._unscored) >= self.risk_batch_size:
+            self._store_scored()
+
+    def _store_scored(self):
+        pages, self._unscored = self._unscored, []
+        if not pages:
+            return
+        # Imported here so the crawler does not need numpy until it scores pages
+        from risk_scoring import default_scorer
+        scores = default_scorer().score_batch(
+            (f"{page['title'] or ''}\n{page['content'] or ''}", page['type']) for page in pages
+        )
+        for page, score in zip(pages, scores):
+            page['risk_level'] = int(score)
+            # Deferred writes are flushed in batches and at every checkpoint
+            self.db_manager.store_website(
+                page['url'], page['title'], page['content'],
+                page['type'], page['geo_location'], page['risk_level'], defer=True
+            )
+            self.db_manager.store_page_fingerprint(
+                page['url'], page.get('etag'), page.get('last_modified'), page.get('content_hash'),
+                links=self._extract_links(page['links']), defer=True
+            )
+
+    def _get_fingerprint(self, url):
+        return self.db_manager.get_page_fingerprint(url) if self.incremental else None
+
+    def _enqueue_links(self, frontier, page_data, seed, current_depth, depth):
+        if current_depth >= depth:
+            return
+        for link in self._extract_links(page_data['links']):
+            self._queue(frontier, link, current_depth + 1, seed)
+
+    def _fetch_page(self, url, fingerprint=None):
+        """Fetch and parse a page in the calling thread."""
+        raw = self._fetch_raw(url, fingerprint)
+        if not raw or raw.get('unchanged'):
+            return raw
         try:
-            session = requests.session()
-            if self.proxy_settings:
-                session.proxies = self.proxy_settings
+            return self._build_page_data(url, parse_page(raw['body'], url), raw)
+        except Exception as e:
+            print(f"[-] Error parsing {url}: {str(e)}")
+            return None
+
+    def _tunnel(self):
+        """Request slot on the VPN gate; waits out a rotation in progress."""
+        if self.vpn:
+            return self.vpn.gate.request(SEARCH_CONFIG.get('vpn_wait', 60))
+        return nullcontext()
 
-            response = session.get(url, timeout=15)
+    def _fetch_raw(self, url, fingerprint=None):
+        """
+        Fetch a page body without parsing it. Given the page's stored fingerprint,
+        the request is made conditional and an unchanged page comes back as
+        {'url': url, 'unchanged': True, 'links': <its stored links>}.
+        """
+        try:
+            headers = {}
+            if fingerprint:
+                if fingerprint.get('etag'):
+                    headers['If-None-Match'] = fingerprint['etag']
+                if fingerprint.get('last_modified'):
+                    headers['If-Modified-Since'] = fingerprint['last_modified']
+
+            with self._tunnel(), self._use_session() as session:
+                if self.proxy_pool:
+                    with self.proxy_pool.lease() as proxies, self._measure(proxies) as sample:
+                        response = sample['response'] = session.get(url, timeout=15, headers=headers,
+                                                                    proxies=proxies)
+                else:
+                    with self._measure(self.proxy_settings) as sample:
+                        response = sample['response'] = session.get(url, timeout=15, headers=headers)
+            if response.status_code == 304:
+                return {'url': url, 'unchanged': True, 'links': (fingerprint or {}).get('links', [])}
             response.raise_for_status()
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            title = soup.title.string if soup.title else "No Title"
-            content = soup.get_text()
-            page_type = self._determine_page_type(url, content)
-            geo_location = "Unknown"
+            # Servers that ignore conditional requests are caught by the content hash
+            content_hash = hashlib.sha256(response.content).hexdigest()
+            if fingerprint and fingerprint.get('content_hash') == content_hash:
+                return {'url': url, 'unchanged': True, 'links': (fingerprint or {}).get('links', [])}
 
-            return {'url': url, 'title': title, 'content': content, 'type': page_type, 'geo_location': geo_location}
+            return {
+                'url': url,
+                'body': response.content,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_hash': content_hash
+            }
         except Exception as e:
             print(f"[-] Error fetching {url}: {str(e)}")
             return None
+        finally:
+            self._failover()
+
+    def _measure(self, proxies):
+        """Time a fetch against the egress it goes out through, when one is monitored."""
+        name = None
+        if self.health:
+            name = self.health.target_for(proxies)
+            if name is None and self.vpn and self.vpn.current_config:
+                name = vpn_target(self.vpn.current_config)
+        return self.health.timed(name) if name else nullcontext({})
 
-    def _extract_links(self, content, base_url):
-        soup = BeautifulSoup(content, 'html.parser')
-        links = []
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            absolute_url = urljoin(base_url, href)
-            if (absolute_url.startswith('http://') or absolute_url.startswith('https://')) and \
-               ('.onion' in absolute_url or '.i2p' in absolute_url):
-                links.append(absolute_url)
-        return links
-
-    def _determine_page_type(self, url, content):
-        if 'product' in url.lower() or 'listing' in url.lower() or 'shop' in url.lower():
+    def _failover(self):
+        """Swap the set_proxy target for the healthiest one once it is demoted."""
+        if not self.health or not self.proxy_settings:
+            return
+        current = self.health.target_for(self.proxy_settings)
+        if current is None or not self.health.is_demoted(current):
+            return
+        replacement = self.health.best_proxy_settings(exclude=current)
+        if replacement is None:
+            return
+        with self._session_lock:
+            if self.proxy_settings == self.health.targets.get(current):
+                print(f"[*] Failing over from {current} to {self.health.target_for(replacement)}")
+                self.proxy_settings = replacement
+                # Pooled connections belong to the old proxy; fetches in flight finish on them first
+                self._retire_session()
+
+    def _build_page_data(self, url, parsed, raw=None):
+        """Turn the output of page_parser.parse_page into a crawl record."""
+        raw = raw or {}
+        return {
+            'url': url,
+            'title': parsed['title'],
+            'content': parsed['text'],
+            'links': parsed['links'],
+            'type': self._determine_page_type(url, parsed['signals']),
+            'geo_location': "Unknown",
+            'etag': raw.get('etag'),
+            'last_modified': raw.get('last_modified'),
+            'content_hash': raw.get('content_hash')
+        }
+
+    def _extract_links(self, links):
+        """Keep only absolute links that point at onion or I2P services."""
+        return [
+            link for link in links
+            if (link.startswith('http://') or link.startswith('https://')) and
+               ('.onion' in link or '.i2p' in link)
+        ]
+
+    def _determine_page_type(self, url, signals=None):
+        url = url.lower()
+        if 'product' in url or 'listing' in url or 'shop' in url:
             return 'marketplace'
-        elif 'forum' in url.lower() or 'discussion' in url.lower():
+        elif 'forum' in url or 'discussion' in url:
             return 'forum'
-        elif 'blog' in url.lower():
+        elif 'blog' in url:
             return 'blog'
-        elif 'chat' in url.lower() or 'message' in url.lower():
+        elif 'chat' in url or 'message' in url:
+            return 'chat'
+
+        # Fall back to what the page itself looks like
+        signals = signals or {}
+        if signals.get('cart_markers', 0) or signals.get('price_mentions', 0) >= 3:
+            return 'marketplace'
+        elif signals.get('forum_markers', 0) >= 3:
+            return 'forum'
+        elif signals.get('chat_markers', 0):
             return 'chat'
-        else:
-            return 'website'
+        return 'website'
@@ -1,85 +1,1005 @@
 import sqlite3
 import json
+import time
+import queue
+import threading
+from pathlib import Path
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 from config import DATABASE_CONFIG
+from user_similarity import USER_LSH
+
+# Tables owned by the tool itself rather than the user-facing schema in config
+INTERNAL_TABLES = {
+    'crawl_frontier': '''
+        CREATE TABLE IF NOT EXISTS crawl_frontier (
+            url TEXT PRIMARY KEY,
+            depth INTEGER NOT NULL,
+            seed TEXT NOT NULL,
+            date_added TEXT
+        )
+    ''',
+    'crawl_visited': '''
+        CREATE TABLE IF NOT EXISTS crawl_visited (
+            url TEXT PRIMARY KEY,
+            seed TEXT NOT NULL,
+            status TEXT NOT NULL,
+            date_visited TEXT
+        )
+    ''',
+    'page_fingerprints': '''
+        CREATE TABLE IF NOT EXISTS page_fingerprints (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            last_checked TEXT,
+            last_changed TEXT,
+            links TEXT
+        )
+    ''',
+    'search_cache': '''
+        CREATE TABLE IF NOT EXISTS search_cache (
+            cache_key TEXT PRIMARY KEY,
+            sources TEXT,
+            has_date_filter INTEGER NOT NULL,
+            results TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''',
+    # Latest change sequence number per website row, kept by triggers
+    'website_changes': '''
+        CREATE TABLE IF NOT EXISTS website_changes (
+            website_id INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    ''',
+    # One row per (user, marketplace), mirrored from users.marketplaces by triggers
+    'user_marketplaces': '''
+        CREATE TABLE IF NOT EXISTS user_marketplaces (
+            user_id INTEGER NOT NULL,
+            marketplace TEXT NOT NULL,
+            PRIMARY KEY (user_id, marketplace)
+        ) WITHOUT ROWID
+    ''',
+    # MinHash LSH band keys of every username; see user_similarity.MinHashLSH
+    'user_lsh': '''
+        CREATE TABLE IF NOT EXISTS user_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (band, bucket, username)
+        ) WITHOUT ROWID
+    ''',
+    # Alias clusters materialized by alias_clusters.AliasClusterer
+    'user_clusters': '''
+        CREATE TABLE IF NOT EXISTS user_clusters (
+            username TEXT PRIMARY KEY,
+            cluster_id TEXT NOT NULL
+        )
+    ''',
+    'alias_token_order': '''
+        CREATE TABLE IF NOT EXISTS alias_token_order (
+            token TEXT PRIMARY KEY,
+            rank INTEGER NOT NULL
+        )
+    ''',
+    'alias_prefix_tokens': '''
+        CREATE TABLE IF NOT EXISTS alias_prefix_tokens (
+            token TEXT NOT NULL,
+            username TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (token, username)
+        ) WITHOUT ROWID
+    ''',
+    # Users stored or changed since they were last clustered, queued by triggers
+    'alias_cluster_pending': '''
+        CREATE TABLE IF NOT EXISTS alias_cluster_pending (
+            username TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    ''',
+    'alias_cluster_state': '''
+        CREATE TABLE IF NOT EXISTS alias_cluster_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''',
+    # Row counts per (metric, bucket) for DataAnalyzer, kept by triggers; see REPORT_METRICS
+    'report_counters': '''
+        CREATE TABLE IF NOT EXISTS report_counters (
+            metric TEXT NOT NULL,
+            bucket,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    'alert_scan_state': '''
+        CREATE TABLE IF NOT EXISTS alert_scan_state (
+            name TEXT PRIMARY KEY,
+            high_water INTEGER NOT NULL,
+            rules_fingerprint TEXT,
+            date_scanned TEXT
+        )
+    ''',
+}
+
+# The upsert keeps first_seen on conflict, so no per-row lookup of the old value is needed
+WEBSITE_UPSERT_SQL = '''
+    INSERT INTO websites
+    (url, title, content, type, first_seen, last_seen, geo_location, risk_level)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        title = excluded.title,
+        content = excluded.content,
+        type = excluded.type,
+        last_seen = excluded.last_seen,
+        geo_location = excluded.geo_location,
+        risk_level = excluded.risk_level
+'''
+
+USER_UPSERT_SQL = '''
+    INSERT INTO users
+    (username, pgp_key, email, marketplaces, products, last_active, geo_location, risk_level)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(username) DO UPDATE SET
+        pgp_key = excluded.pgp_key,
+        email = excluded.email,
+        marketplaces = excluded.marketplaces,
+        products = excluded.products,
+        last_active = excluded.last_active,
+        geo_location = excluded.geo_location,
+        risk_level = excluded.risk_level
+'''
+
+PAGE_FINGERPRINT_SQL = '''
+    INSERT OR REPLACE INTO page_fingerprints
+    (url, etag, last_modified, content_hash, last_checked, last_changed, links)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Results are unique per (keyword, url); a repeat sighting refreshes the row
+SEARCH_RESULT_INSERT_SQL = '''
+    INSERT INTO search_results (keyword, url, title, snippet, relevance, date_found)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(keyword, url) DO UPDATE SET
+        title = excluded.title,
+        snippet = excluded.snippet,
+        relevance = excluded.relevance,
+        date_found = excluded.date_found
+'''
+
+# Alerts with the same fingerprint are one incident; repeats bump its counter
+ALERT_INSERT_SQL = '''
+    INSERT INTO alerts (type, content, severity, date_created, status, fingerprint, hit_count, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(fingerprint) WHERE fingerprint IS NOT NULL DO UPDATE SET
+        hit_count = hit_count + excluded.hit_count,
+        last_seen = excluded.last_seen,
+        severity = MAX(severity, excluded.severity)
+'''
+
+# High-water mark and model fingerprint of an incremental job over website_changes
+SCAN_STATE_SQL = '''
+    INSERT INTO alert_scan_state (name, high_water, rules_fingerprint, date_scanned)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET
+        high_water = excluded.high_water,
+        rules_fingerprint = excluded.rules_fingerprint,
+        date_scanned = excluded.date_scanned
+'''
+
+
+def ensure_unique_index(cursor, table, column):
+    """Make `column` unique, keeping the newest row of any duplicates, unless it already is."""
+    for _, index_name, unique, *_ in cursor.execute(f'PRAGMA index_list({table})').fetchall():
+        columns = [row[2] for row in cursor.execute(f'PRAGMA index_info({index_name})').fetchall()]
+        if unique and columns == [column]:
+            return
+    cursor.execute(f'DELETE FROM {table} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {table} GROUP BY {column})')
+    cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})')
+
+
+def add_column(cursor, table, column, definition):
+    """Add a column unless the table already has it."""
+    if column not in [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def create_fulltext_index(cursor):
+    """
+    Build an FTS5 index over websites(title, content), kept in sync by
+    triggers. Builds of SQLite without FTS5 skip it and search falls back
+    to a LIKE scan.
+    """
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS websites_fts
+            USING fts5(title, content, content='websites', tokenize='unicode61 remove_diacritics 2')
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"[-] Full-text index unavailable, search will scan content: {str(e)}")
+        return
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS websites_fts_insert AFTER INSERT ON websites BEGIN
+            INSERT INTO websites_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS websites_fts_delete AFTER DELETE ON websites BEGIN
+            INSERT INTO websites_fts(websites_fts, rowid, title, content)
+            VALUES ('delete', old.rowid, old.title, old.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS websites_fts_update AFTER UPDATE OF title, content ON websites BEGIN
+            INSERT INTO websites_fts(websites_fts, rowid, title, content)
+            VALUES ('delete', old.rowid, old.title, old.content);
+            INSERT INTO websites_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+        END
+    ''')
+    cursor.execute("INSERT INTO websites_fts(websites_fts) VALUES ('rebuild')")
+
+
+def create_change_log(cursor):
+    """
+    Number every insert of a website and every change to its title or
+    content, so incremental jobs can pick up where they stopped. Existing
+    rows are numbered in rowid order.
+    """
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_website_changes_seq ON website_changes(seq)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS website_changes_insert AFTER INSERT ON websites BEGIN
+            INSERT INTO website_changes(website_id, seq)
+            VALUES (new.rowid, (SELECT COALESCE(MAX(seq), 0) + 1 FROM website_changes));
+        END
+    ''')
+    # The upsert rewrites content on every store; only real changes get a new number
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS website_changes_update AFTER UPDATE OF title, content ON websites
+        WHEN old.title IS NOT new.title OR old.content IS NOT new.content BEGIN
+            UPDATE website_changes SET seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM website_changes)
+            WHERE website_id = new.rowid;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS website_changes_delete AFTER DELETE ON websites BEGIN
+            DELETE FROM website_changes WHERE website_id = old.rowid;
+        END
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO website_changes(website_id, seq) SELECT rowid, rowid FROM websites')
+
+
+# Decodes a JSON list column, including lists that were JSON-encoded twice
+JSON_LIST_SQL = '''CASE
+    WHEN NOT json_valid({col}) THEN '[]'
+    WHEN json_type({col}) = 'array' THEN {col}
+    WHEN json_type({col}) = 'text' AND json_valid(json_extract({col}, '$'))
+        THEN CASE WHEN json_type(json_extract({col}, '$')) = 'array' THEN json_extract({col}, '$') ELSE '[]' END
+    ELSE '[]'
+END'''
+
+# metric -> (table, columns, bucket expression over {row})
+REPORT_METRICS = {
+    'website_type': ('websites', ['type'], '{row}.type'),
+    'website_risk': ('websites', ['risk_level'], '{row}.risk_level'),
+    'website_first_seen': ('websites', ['first_seen'], 'substr({row}.first_seen, 1, 10)'),
+    'user_month': ('users', ['last_active'], 'substr({row}.last_active, 1, 7)'),
+    'user_risk': ('users', ['risk_level'], '{row}.risk_level'),
+    'user_marketplace': ('user_marketplaces', ['marketplace'], '{row}.marketplace'),
+    'alert_severity': ('alerts', ['severity'], '{row}.severity'),
+    'alert_type': ('alerts', ['type'], '{row}.type'),
+    'alert_date': ('alerts', ['date_created'], 'substr({row}.date_created, 1, 10)'),
+}
+
+
+def _report_bump_sql(metric, expr, row, delta):
+    bucket = expr.format(row=row)
+    return f'''
+        INSERT INTO report_counters (metric, bucket, count)
+        SELECT '{metric}', {bucket}, 0
+        WHERE NOT EXISTS (SELECT 1 FROM report_counters WHERE metric = '{metric}' AND bucket IS {bucket});
+        UPDATE report_counters SET count = count {delta} 1 WHERE metric = '{metric}' AND bucket IS {bucket};
+    '''
+
+
+def report_rebuild_sql(metric):
+    """SELECT computing (metric, bucket, count) rows for `metric` from its table."""
+    table, _, expr = REPORT_METRICS[metric]
+    return f"SELECT '{metric}', {expr.format(row='t')} AS bucket, COUNT(*) FROM {table} t GROUP BY bucket"
+
+
+def create_report_triggers(cursor):
+    """
+    Keep report_counters current on every insert, delete and relevant
+    update of the reported tables.
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_report_counters ON report_counters(metric, bucket)')
+    tables = {}
+    for metric, (table, columns, expr) in REPORT_METRICS.items():
+        tables.setdefault(table, []).append((metric, columns, expr))
+    for table, metrics in tables.items():
+        columns = list(dict.fromkeys(column for _, cols, _ in metrics for column in cols))
+        changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in columns)
+        inserts = ''.join(_report_bump_sql(metric, expr, 'new', '+') for metric, _, expr in metrics)
+        deletes = ''.join(_report_bump_sql(metric, expr, 'old', '-') for metric, _, expr in metrics)
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_report_insert AFTER INSERT ON {table} '
+                       f'BEGIN {inserts} END')
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_report_delete AFTER DELETE ON {table} '
+                       f'BEGIN {deletes} END')
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_report_update '
+                       f'AFTER UPDATE OF {", ".join(columns)} ON {table} WHEN {changed} '
+                       f'BEGIN {deletes} {inserts} END')
+    cursor.execute('DELETE FROM report_counters')
+    for metric in REPORT_METRICS:
+        cursor.execute(f'INSERT INTO report_counters (metric, bucket, count) {report_rebuild_sql(metric)}')
+
+
+def create_marketplace_links(cursor):
+    """
+    Mirror users.marketplaces into user_marketplaces with triggers, after
+    repairing lists that were JSON-encoded twice, and backfill it.
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_marketplaces_marketplace '
+                   'ON user_marketplaces(marketplace, user_id)')
+    for column in ('marketplaces', 'products'):
+        cursor.execute(f'''
+            UPDATE users SET {column} = json_extract({column}, '$')
+            WHERE json_valid({column}) AND json_type({column}) = 'text'
+              AND json_valid(json_extract({column}, '$')) AND json_type(json_extract({column}, '$')) = 'array'
+        ''')
+    marketplaces = JSON_LIST_SQL.format(col='new.marketplaces')
+    link_new = f'''
+        INSERT INTO user_marketplaces (user_id, marketplace)
+        SELECT DISTINCT new.rowid, j.value FROM json_each({marketplaces}) j
+        WHERE j.value IS NOT NULL;
+    '''
+    unlink_old = 'DELETE FROM user_marketplaces WHERE user_id = old.rowid;'
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS users_marketplaces_insert AFTER INSERT ON users '
+                   f'BEGIN {link_new} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS users_marketplaces_delete AFTER DELETE ON users '
+                   f'BEGIN {unlink_old} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS users_marketplaces_update AFTER UPDATE OF marketplaces ON users '
+                   f'WHEN old.marketplaces IS NOT new.marketplaces BEGIN {unlink_old} {link_new} END')
+    cursor.execute('DELETE FROM user_marketplaces')
+    cursor.execute(f'''
+        INSERT INTO user_marketplaces (user_id, marketplace)
+        SELECT DISTINCT u.rowid, j.value FROM users u, json_each({JSON_LIST_SQL.format(col='u.marketplaces')}) j
+        WHERE j.value IS NOT NULL
+    ''')
+
+
+USER_LSH_INSERT_SQL = 'INSERT OR IGNORE INTO user_lsh (band, bucket, username) VALUES (?, ?, ?)'
+
+
+def create_user_lsh(cursor, chunk_size=10000):
+    """Index every existing username in user_lsh and drop entries with their user."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_lsh_username ON user_lsh(username)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_lsh_delete AFTER DELETE ON users BEGIN
+            DELETE FROM user_lsh WHERE username = old.username;
+        END
+    ''')
+    usernames = [row[0] for row in cursor.execute('SELECT username FROM users WHERE username IS NOT NULL')]
+    for start in range(0, len(usernames), chunk_size):
+        cursor.executemany(USER_LSH_INSERT_SQL, [
+            row for username in usernames[start:start + chunk_size] for row in USER_LSH.rows_for(username)
+        ])
+
+
+def create_alias_queue(cursor):
+    """
+    Queue every inserted user, and every user whose username, pgp_key or
+    email changes, in alias_cluster_pending for AliasClusterer.apply_pending.
+    A requeue gets a new seq, so a drain only removes the entry it read.
+    Users that were never clustered are queued now.
+    """
+    enqueue = '''
+        INSERT OR REPLACE INTO alias_cluster_pending (username, seq)
+        VALUES (new.username, (SELECT COALESCE(MAX(seq), 0) + 1 FROM alias_cluster_pending));
+    '''
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS users_alias_pending_insert AFTER INSERT ON users '
+                   f'WHEN new.username IS NOT NULL BEGIN {enqueue} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS users_alias_pending_update '
+                   f'AFTER UPDATE OF username, pgp_key, email ON users WHEN new.username IS NOT NULL AND '
+                   f'(old.username IS NOT new.username OR old.pgp_key IS NOT new.pgp_key OR old.email IS NOT new.email) '
+                   f'BEGIN {enqueue} END')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_alias_pending_delete AFTER DELETE ON users BEGIN
+            DELETE FROM alias_cluster_pending WHERE username = old.username;
+        END
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO alias_cluster_pending (username, seq)
+        SELECT username, rowid FROM users
+        WHERE username IS NOT NULL AND username NOT IN (SELECT username FROM user_clusters)
+    ''')
+
+
+# Ordered (version, description, steps) migrations tracked in PRAGMA user_version.
+# A step is either an SQL string or a callable taking a cursor.
+SCHEMA_MIGRATIONS = [
+    (1, "indexes for hot lookup paths", [
+        # store_website upserts on url, which needs a unique index
+        lambda cursor: ensure_unique_index(cursor, 'websites', 'url'),
+        'CREATE INDEX IF NOT EXISTS idx_websites_first_seen ON websites(first_seen)',
+        'CREATE INDEX IF NOT EXISTS idx_websites_type ON websites(type)',
+        'CREATE INDEX IF NOT EXISTS idx_websites_risk_level ON websites(risk_level)',
+        'CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active)',
+        'CREATE INDEX IF NOT EXISTS idx_users_risk_level ON users(risk_level)',
+        'CREATE INDEX IF NOT EXISTS idx_search_results_keyword_date '
+        'ON search_results(keyword, date_found DESC, relevance DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_search_results_date ON search_results(date_found DESC, relevance DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_severity_date ON alerts(severity DESC, date_created DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_status_severity_date '
+        'ON alerts(status, severity DESC, date_created DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_date_created ON alerts(date_created)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_type ON alerts(type)',
+    ]),
+    (2, "full-text index over website content", [
+        create_fulltext_index,
+        'CREATE INDEX IF NOT EXISTS idx_websites_last_seen ON websites(last_seen)',
+    ]),
+    (3, "unique search results per keyword and url", [
+        '''DELETE FROM search_results WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM search_results GROUP BY keyword, url
+        )''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_search_results_keyword_url ON search_results(keyword, url)',
+    ]),
+    (4, "change sequence for incremental website scans", [
+        create_change_log,
+    ]),
+    (5, "alert fingerprints and hit counters", [
+        lambda cursor: add_column(cursor, 'alerts', 'fingerprint', 'TEXT'),
+        lambda cursor: add_column(cursor, 'alerts', 'hit_count', 'INTEGER NOT NULL DEFAULT 1'),
+        lambda cursor: add_column(cursor, 'alerts', 'last_seen', 'TEXT'),
+        'UPDATE alerts SET last_seen = date_created WHERE last_seen IS NULL',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_fingerprint ON alerts(fingerprint) '
+        'WHERE fingerprint IS NOT NULL',
+    ]),
+    (6, "trigger-maintained report counters", [
+        # store_user upserts on username; REPLACE would skip the delete triggers
+        lambda cursor: ensure_unique_index(cursor, 'users', 'username'),
+        create_report_triggers,
+    ]),
+    (7, "normalized user marketplaces", [
+        create_marketplace_links,
+        # Marketplace counts now come from the link table instead of decoding JSON
+        'DROP TRIGGER IF EXISTS users_report_insert',
+        'DROP TRIGGER IF EXISTS users_report_delete',
+        'DROP TRIGGER IF EXISTS users_report_update',
+        create_report_triggers,
+    ]),
+    (8, "MinHash LSH index over usernames", [
+        create_user_lsh,
+    ]),
+    (9, "alias cluster lookups", [
+        'CREATE INDEX IF NOT EXISTS idx_users_pgp_key ON users(pgp_key)',
+        'CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)',
+        'CREATE INDEX IF NOT EXISTS idx_user_clusters_cluster ON user_clusters(cluster_id)',
+        'CREATE INDEX IF NOT EXISTS idx_alias_prefix_tokens_username ON alias_prefix_tokens(username)',
+        '''CREATE TRIGGER IF NOT EXISTS users_alias_delete AFTER DELETE ON users BEGIN
+            DELETE FROM alias_prefix_tokens WHERE username = old.username;
+            DELETE FROM user_clusters WHERE username = old.username;
+        END''',
+    ]),
+    (10, "durable alias cluster queue", [
+        create_alias_queue,
+    ]),
+    (11, "outlinks of fingerprinted pages", [
+        # An unchanged page is not re-parsed, so its links are kept for the next crawl
+        lambda cursor: add_column(cursor, 'page_fingerprints', 'links', 'TEXT'),
+    ]),
+]
+
+# Pragmas applied in write-behind mode; DATABASE_CONFIG['pragmas'] overrides them
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',    # WAL stays consistent on crash; only the last commits can be lost
+    'cache_size': -65536,       # negative values are KiB, so 64 MiB
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+
+# Pragmas that only make sense on the connection that writes
+WRITER_ONLY_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+def apply_pragmas(conn, pragmas, read_only=False):
+    for name, value in pragmas.items():
+        if read_only and name in WRITER_ONLY_PRAGMAS:
+            continue
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+# ---------------- Write-Behind Thread ----------------
+class WriteBehindThread(threading.Thread):
+    """
+    Owns the only writing connection in write-behind mode. Submitted batches
+    are executed in submission order; whatever is queued when the thread
+    wakes up is committed as one transaction, with a savepoint per batch so
+    one bad batch does not roll back the others. The connection can also be
+    lent to another thread for an explicit transaction, between batches.
+    """
+
+    def __init__(self, db_path, pragmas, max_pending=1000):
+        super().__init__(name="db-writer", daemon=True)
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.queue = queue.Queue(maxsize=max_pending)
+
+    def submit(self, batches):
+        """Queue a list of (sql, rows) pairs and return a Future for the result."""
+        future = Future()
+        self.queue.put((batches, future))
+        return future
+
+    def lend(self, released):
+        """
+        Return a Future for the writing connection, handed over once the
+        batches queued before it are committed. The thread waits, writing
+        nothing, until `released` is set.
+        """
+        future = Future()
+        self.queue.put((released, future))
+        return future
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        # A lent connection is used from the borrowing thread
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        apply_pragmas(conn, self.pragmas)
+        running = True
+        while running:
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in items:
+                running = False
+                items = [item for item in items if item is not None]
+            batches = []
+            for item in items:
+                if isinstance(item[0], threading.Event):
+                    if batches:
+                        self._commit(conn, batches)
+                        batches = []
+                    item[1].set_result(conn)
+                    item[0].wait()
+                else:
+                    batches.append(item)
+            if batches:
+                self._commit(conn, batches)
+        conn.close()
+
+    def _commit(self, conn, items):
+        done = []
+        try:
+            conn.execute('BEGIN')
+            for batches, future in items:
+                conn.execute('SAVEPOINT batch')
+                try:
+                    for sql, rows in batches:
+                        conn.executemany(sql, rows)
+                    conn.execute('RELEASE batch')
+                    done.append(future)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO batch')
+                    conn.execute('RELEASE batch')
+                    print(f"[-] Background write failed: {str(e)}")
+                    future.set_exception(e)
+            conn.execute('COMMIT')
+        except Exception as e:
+            print(f"[-] Background commit failed: {str(e)}")
+            try:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+            except sqlite3.Error as rollback_error:
+                print(f"[-] Background rollback failed: {str(rollback_error)}")
+            # Nothing in this commit was written; resolve every waiter, including the batches not reached
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in done:
+            future.set_result(True)
+
+
+# ---------------- Batch Writer ----------------
+class BatchWriter:
+    """
+    Buffers write statements and applies them with executemany in a single
+    transaction once `flush_size` rows are pending or `flush_interval`
+    seconds have passed since the last flush. Statement order is preserved.
+    """
+
+    def __init__(self, db_manager, flush_size=500, flush_interval=2.0):
+        self.db_manager = db_manager
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.batches = []           # list of [sql, [params, ...]] in submission order
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, sql, params):
+        with self.lock:
+            self._append(sql, params)
+            due = self.pending >= self.flush_size or time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            # Size/interval flushes do not wait for the write-behind thread
+            self.flush(wait=False)
+
+    def _append(self, sql, params):
+        # Caller holds self.lock
+        if self.batches and self.batches[-1][0] == sql:
+            self.batches[-1][1].append(params)
+        else:
+            self.batches.append([sql, [params]])
+        self.pending += 1
+
+    def holds(self, sql, key):
+        """True if a buffered `sql` statement has `key` as its first parameter."""
+        with self.lock:
+            return any(params[0] == key for batch_sql, rows in self.batches if batch_sql == sql for params in rows)
+
+    def flush(self, wait=True):
+        """Write every buffered statement in one transaction. Returns False on failure."""
+        # Writes that flush listeners coalesced since the last flush go out with it
+        statements = self.db_manager.flush_statements()
+        with self.lock:
+            for sql, params in statements:
+                self._append(sql, params)
+            batches, self.batches, self.pending = self.batches, [], 0
+            self.last_flush = time.monotonic()
+        try:
+            if batches or wait:
+                self.db_manager.execute_batches(batches, wait=wait)
+            return True
+        except Exception as e:
+            print(f"[-] Error flushing {sum(len(rows) for _, rows in batches)} buffered writes: {str(e)}")
+            return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
 
 # ---------------- Database Manager ----------------
 class DataBaseManager:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, write_behind=None):
         self.db_path = db_path or DATABASE_CONFIG['path']
+        self.write_behind = DATABASE_CONFIG.get('write_behind', False) if write_behind is None else write_behind
+        if self.write_behind and self.db_path == ':memory:':
+            print("[-] Write-behind mode needs a database file; using a single connection")
+            self.write_behind = False
+        self.pragmas = {**DEFAULT_PRAGMAS, **DATABASE_CONFIG.get('pragmas', {})}
         self.conn = None
+        self.writer_thread = None
+        self._readers = threading.local()
+        self._reader_conns = []
+        self.website_listeners = []
+        self.user_listeners = []
+        self.flush_listeners = []
+        self._unsynced = None       # Future of the last write-behind batch nobody waited for
         self.connect()
         self.create_tables()
+        self.writer = BatchWriter(
+            self,
+            flush_size=DATABASE_CONFIG.get('flush_size', 500),
+            flush_interval=DATABASE_CONFIG.get('flush_interval', 2.0)
+        )
+        if self.write_behind:
+            self.writer_thread = WriteBehindThread(self.db_path, self.pragmas)
+            self.writer_thread.start()
 
     def connect(self):
         try:
             self.conn = sqlite3.connect(self.db_path)
+            if self.write_behind:
+                apply_pragmas(self.conn, self.pragmas)
             print(f"[+] Connected to database: {self.db_path}")
         except Exception as e:
             print(f"[-] Database connection error: {str(e)}")
 
+    def reader(self):
+        """
+        Return a connection for queries. In write-behind mode every thread gets
+        its own read-only connection, so reports never wait on ingest.
+        """
+        if not self.write_behind:
+            return self.conn
+        conn = getattr(self._readers, 'conn', None)
+        if conn is None:
+            uri = Path(self.db_path).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            apply_pragmas(conn, self.pragmas, read_only=True)
+            self._readers.conn = conn
+            self._reader_conns.append(conn)
+        return conn
+
     def create_tables(self):
         cursor = self.conn.cursor()
-        for table_name, table_sql in DATABASE_CONFIG['tables'].items():
+        tables = {**DATABASE_CONFIG['tables'], **INTERNAL_TABLES}
+        for table_name, table_sql in tables.items():
             try:
                 cursor.execute(table_sql)
                 print(f"[+] Table '{table_name}' created or already exists")
             except Exception as e:
                 print(f"[-] Error creating table '{table_name}': {str(e)}")
         self.conn.commit()
+        self.migrate()
 
-    # ---------------- Websites ----------------
-    def store_website(self, url, title, content, website_type, geo_location, risk_level=0):
+    def schema_version(self):
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def migrate(self):
+        """Apply every schema migration newer than the database's user_version."""
+        version = self.schema_version()
+        for target, description, steps in SCHEMA_MIGRATIONS:
+            if target <= version:
+                continue
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN')
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(f'PRAGMA user_version = {target}')
+                self.conn.commit()
+                print(f"[+] Applied schema migration {target}: {description}")
+            except Exception as e:
+                self.conn.rollback()
+                print(f"[-] Schema migration {target} failed: {str(e)}")
+                break
+
+    # ---------------- Transactions ----------------
+    @contextmanager
+    def transaction(self):
+        """
+        Run a unit of work that is committed as a whole or rolled back on
+        error. In write-behind mode it runs on the writer thread's connection,
+        in order with the queued batches.
+        """
+        if self.writer_thread:
+            released = threading.Event()
+            conn = self.writer_thread.lend(released).result()
+            try:
+                conn.execute('BEGIN')
+                yield conn.cursor()
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            finally:
+                released.set()
+            return
         cursor = self.conn.cursor()
-        current_date = datetime.now().strftime("%Y-%m-%d")
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO websites
-                (url, title, content, type, first_seen, last_seen, geo_location, risk_level)
-                VALUES (?, ?, ?, ?, COALESCE((SELECT first_seen FROM websites WHERE url = ?), ?), ?, ?, ?)
-            ''', (url, title, content, website_type, url, current_date, current_date, geo_location, risk_level))
+            yield cursor
             self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def execute_batches(self, batches, wait=True):
+        """
+        Run (sql, rows) pairs with executemany as one unit of work. In
+        write-behind mode they go to the writer thread; `wait` blocks until
+        they are committed and re-raises any error.
+        """
+        if self.writer_thread:
+            future = self.writer_thread.submit(batches)
+            if wait:
+                future.result()
+            else:
+                self._unsynced = future
+            return True
+        with self.transaction() as cursor:
+            for sql, rows in batches:
+                cursor.executemany(sql, rows)
+        return True
+
+    def sync(self):
+        """Wait until writes handed to the writer thread without waiting are committed."""
+        future, self._unsynced = self._unsynced, None
+        if future is not None:
+            # Batches run in order, so the last one done means all are
+            try:
+                future.result()
+            except Exception:
+                pass    # already reported by the writer thread
+
+    def _write(self, statements, defer, label):
+        """
+        Execute (sql, params) statements in one transaction, or hand them to
+        the batch writer when `defer` is set.
+        """
+        if defer:
+            for sql, params in statements:
+                self.writer.add(sql, params)
+            return True
+        try:
+            self.execute_batches([(sql, [params]) for sql, params in statements])
             return True
         except Exception as e:
-            print(f"[-] Error storing website: {str(e)}")
+            print(f"[-] Error storing {label}: {str(e)}")
             return False
 
-    # ---------------- Users ----------------
-    def store_user(self, username, pgp_key, email, marketplaces, products, geo_location, risk_level=0):
-        cursor = self.conn.cursor()
+    def flush(self):
+        """Write out everything buffered by deferred store_* calls."""
+        return self.writer.flush()
+
+    def flush_statements(self):
+        """Collect the (sql, params) statements flush listeners hand over."""
+        statements = []
+        for callback in self.flush_listeners:
+            try:
+                statements.extend(callback())
+            except Exception as e:
+                print(f"[-] Flush listener error: {str(e)}")
+        return statements
+
+    # ---------------- Change Listeners ----------------
+    def add_website_listener(self, callback):
+        """
+        Register callback(urls, content_changed) to run whenever stored pages
+        change. content_changed is False when only last_seen was bumped.
+        """
+        self.website_listeners.append(callback)
+
+    def _notify_website_change(self, urls, content_changed):
+        for callback in self.website_listeners:
+            try:
+                callback(urls, content_changed)
+            except Exception as e:
+                print(f"[-] Website listener error: {str(e)}")
+
+    def add_user_listener(self, callback):
+        """Register callback(username, pgp_key, email) to run whenever a user is stored."""
+        self.user_listeners.append(callback)
+
+    def add_flush_listener(self, callback):
+        """
+        Register callback() returning (sql, params) statements that are written
+        with every flush of the batch writer, for writes coalesced elsewhere.
+        """
+        self.flush_listeners.append(callback)
+
+    # ---------------- Websites ----------------
+    def store_website(self, url, title, content, website_type, geo_location, risk_level=0, defer=False):
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        params = (url, title, content, website_type, current_date, current_date, geo_location, risk_level)
+        self._notify_website_change([url], content_changed=True)
+        return self._write([(WEBSITE_UPSERT_SQL, params)], defer, "website")
+
+    def store_websites(self, pages):
+        """Bulk-store page dicts as produced by the crawler in one transaction."""
         current_date = datetime.now().strftime("%Y-%m-%d")
+        self._notify_website_change([page['url'] for page in pages], content_changed=True)
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO users
-                (username, pgp_key, email, marketplaces, products, last_active, geo_location, risk_level)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (username, pgp_key, email,
-                  json.dumps(marketplaces) if marketplaces else None,
-                  json.dumps(products) if products else None,
-                  current_date, geo_location, risk_level))
-            self.conn.commit()
+            self.execute_batches([(WEBSITE_UPSERT_SQL, [
+                (page['url'], page['title'], page['content'], page['type'], current_date, current_date,
+                 page['geo_location'], page.get('risk_level', 0))
+                for page in pages
+            ])])
             return True
         except Exception as e:
-            print(f"[-] Error storing user: {str(e)}")
+            print(f"[-] Error storing websites: {str(e)}")
             return False
 
-    # ---------------- Search Results ----------------
-    def store_search_result(self, keyword, url, title, snippet, relevance=0):
-        cursor = self.conn.cursor()
+    def touch_website(self, url, defer=False):
+        """Bump last_seen for a page that was re-checked and found unchanged."""
         current_date = datetime.now().strftime("%Y-%m-%d")
+        self._notify_website_change([url], content_changed=False)
+        return self._write([
+            ('UPDATE websites SET last_seen = ? WHERE url = ?', (current_date, url)),
+            ('UPDATE page_fingerprints SET last_checked = ? WHERE url = ?', (current_date, url)),
+        ], defer, "website")
+
+    def store_page_fingerprint(self, url, etag, last_modified, content_hash, links=None, defer=False):
+        """Record the validators used for conditional recrawls of a page, and its crawlable links."""
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        return self._write([(PAGE_FINGERPRINT_SQL, (url, etag, last_modified, content_hash, current_date, current_date,
+              json.dumps(links) if links is not None else None))], defer, "page fingerprint")
+
+    def get_page_fingerprint(self, url):
+        # Read our own writes: a buffered fingerprint of this url is written first
+        if self.writer.holds(PAGE_FINGERPRINT_SQL, url):
+            self.flush()
+        else:
+            self.sync()
+        cursor = self.reader().cursor()
         try:
-            cursor.execute('''
-                INSERT INTO search_results (keyword, url, title, snippet, relevance, date_found)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (keyword, url, title, snippet, relevance, current_date))
-            self.conn.commit()
-            return True
+            cursor.execute(
+                'SELECT etag, last_modified, content_hash, links FROM page_fingerprints WHERE url = ?', (url,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2],
+                    'links': json.loads(row[3]) if row[3] else []}
         except Exception as e:
-            print(f"[-] Error storing search result: {str(e)}")
-            return False
+            print(f"[-] Error retrieving page fingerprint: {str(e)}")
+            return None
+
+    # ---------------- Users ----------------
+    def store_user(self, username, pgp_key, email, marketplaces, products, geo_location, risk_level=0, defer=False):
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        lsh_rows = [(USER_LSH_INSERT_SQL, row) for row in USER_LSH.rows_for(username)] if username else []
+        for callback in self.user_listeners:
+            try:
+                callback(username, pgp_key, email)
+            except Exception as e:
+                print(f"[-] User listener error: {str(e)}")
+        return self._write([(USER_UPSERT_SQL, (username, pgp_key, email,
+              json.dumps(marketplaces) if marketplaces else None,
+              json.dumps(products) if products else None,
+              current_date, geo_location, risk_level))] + lsh_rows, defer, "user")
+
+    def get_lsh_candidates(self, keys_by_query):
+        """
+        Return {query: set of usernames} sharing at least one LSH band key,
+        where `keys_by_query` maps each query to its per-band keys.
+        """
+        candidates = {query: set() for query in keys_by_query}
+        queries = list(keys_by_query)
+        rows = [(i, band, key) for i, query in enumerate(queries) for band, key in enumerate(keys_by_query[query])]
+        cursor = self.reader().cursor()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(rows), 300):
+            chunk = rows[start:start + 300]
+            cursor.execute(f'''
+                WITH keys(query, band, bucket) AS (VALUES {', '.join(['(?, ?, ?)'] * len(chunk))})
+                SELECT keys.query, l.username FROM keys
+                JOIN user_lsh l ON l.band = keys.band AND l.bucket = keys.bucket
+            ''', [value for row in chunk for value in row])
+            for i, username in cursor.fetchall():
+                candidates[queries[i]].add(username)
+        return candidates
+
+    def get_user_marketplaces(self, username):
+        """Return the marketplaces a user is linked to."""
+        cursor = self.reader().cursor()
+        cursor.execute('''
+            SELECT m.marketplace FROM users u JOIN user_marketplaces m ON m.user_id = u.id
+            WHERE u.username = ? ORDER BY m.marketplace
+        ''', (username,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_marketplace_users(self, marketplace, limit=None):
+        """Return the usernames linked to a marketplace."""
+        cursor = self.reader().cursor()
+        cursor.execute('''
+            SELECT u.username FROM user_marketplaces m JOIN users u ON u.id = m.user_id
+            WHERE m.marketplace = ? ORDER BY u.username LIMIT ?
+        ''', (marketplace, -1 if limit is None else limit))
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_top_marketplaces(self, limit=10):
+        """Return {marketplace: user count} for the marketplaces with the most users."""
+        return self.get_report_counts('user_marketplace', order_by='count', limit=limit)
+
+    # ---------------- Search Results ----------------
+    def store_search_result(self, keyword, url, title, snippet, relevance=0, defer=False):
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        params = (keyword, url, title, snippet, relevance, current_date)
+        return self._write([(SEARCH_RESULT_INSERT_SQL, params)], defer, "search result")
 
     def get_search_results(self, keyword=None, limit=50):
-        cursor = self.conn.cursor()
+        self.flush()
+        cursor = self.reader().cursor()
         try:
             if keyword:
                 cursor.execute('''
@@ -99,9 +1019,86 @@ class DataBaseManager:
             print(f"[-] Error retrieving search results: {str(e)}")
             return []
 
+    def has_fulltext_index(self):
+        row = self.reader().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'websites_fts'"
+        ).fetchone()
+        return row is not None
+
+    def search_content(self, keyword, sources=None, since=None, limit=100):
+        """
+        Search stored page titles and content for a keyword or phrase.
+        Returns dicts with url, title, snippet, relevance, last_seen and
+        geo_location, best matches first.
+        """
+        self.flush()
+        filters, params = [], []
+        if sources:
+            filters.append(f"w.url IN ({', '.join('?' * len(sources))})")
+            params.extend(sources)
+        if since:
+            filters.append("w.last_seen >= ?")
+            params.append(since)
+        where = ''.join(f" AND {f}" for f in filters)
+
+        cursor = self.reader().cursor()
+        try:
+            if self.has_fulltext_index():
+                # Quote the keyword so FTS5 treats it as a phrase, not query syntax
+                phrase = '"' + keyword.replace('"', '""') + '"'
+                cursor.execute(f'''
+                    SELECT w.url, w.title, snippet(websites_fts, 1, '', '', '...', 16),
+                           -bm25(websites_fts, 5.0, 1.0), w.last_seen, w.geo_location
+                    FROM websites_fts JOIN websites w ON w.rowid = websites_fts.rowid
+                    WHERE websites_fts MATCH ?{where}
+                    ORDER BY bm25(websites_fts, 5.0, 1.0)
+                    LIMIT ?
+                ''', [phrase, *params, limit])
+                rows = cursor.fetchall()
+            else:
+                # Escape LIKE wildcards so the keyword matches literally
+                pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                cursor.execute(f'''
+                    SELECT w.url, w.title, w.content, 0, w.last_seen, w.geo_location
+                    FROM websites w
+                    WHERE (w.title LIKE ? ESCAPE '\\' OR w.content LIKE ? ESCAPE '\\'){where}
+                    LIMIT ?
+                ''', [pattern, pattern, *params, limit])
+                rows = [(url, title, self._make_snippet(content or '', keyword), *rest)
+                        for url, title, content, *rest in cursor.fetchall()]
+            return [
+                {'url': url, 'title': title, 'snippet': snippet, 'relevance': relevance,
+                 'last_seen': last_seen, 'geo_location': geo_location}
+                for url, title, snippet, relevance, last_seen, geo_location in rows
+            ]
+        except Exception as e:
+            print(f"[-] Error searching content: {str(e)}")
+            return []
+
+    @staticmethod
+    def _make_snippet(text, keyword, width=80):
+        pos = text.lower().find(keyword.lower())
+        if pos < 0:
+            return text[:width * 2]
+        start = max(pos - width, 0)
+        return ('...' if start else '') + text[start:pos + len(keyword) + width] + '...'
+
+    def get_stale_urls(self, before, limit=None):
+        """Return URLs whose last_seen date is older than `before`."""
+        cursor = self.reader().cursor()
+        try:
+            cursor.execute(
+                'SELECT url FROM websites WHERE last_seen < ? ORDER BY last_seen LIMIT ?',
+                (before, -1 if limit is None else limit)
+            )
+            return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"[-] Error retrieving stale URLs: {str(e)}")
+            return []
+
     def get_all_urls(self):
         """Retrieve all website URLs from the database"""
-        cursor = self.conn.cursor()
+        cursor = self.reader().cursor()
         try:
             cursor.execute('SELECT url FROM websites')
             urls = [row[0] for row in cursor.fetchall()]
@@ -110,8 +1107,169 @@ class DataBaseManager:
             print(f"[-] Error retrieving URLs: {str(e)}")
             return []
 
+    # ---------------- Alerts ----------------
+    def store_alert(self, alert_type, content, severity, status="new", defer=False, fingerprint=None, hits=1):
+        """Store an alert, or add `hits` to the stored incident with the same fingerprint."""
+        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        params = (alert_type, content, severity, current_date, status, fingerprint, hits, current_date)
+        return self._write([(ALERT_INSERT_SQL, params)], defer, "alert")
+
+    # ---------------- Report Counters ----------------
+    def get_report_counts(self, metric, since=None, order_by='bucket', limit=None):
+        """
+        Return {bucket: count} for a REPORT_METRICS metric, newest or
+        largest bucket first. `since` keeps buckets >= since.
+        """
+        self.flush()
+        query = 'SELECT bucket, count FROM report_counters WHERE metric = ? AND count > 0'
+        params = [metric]
+        if since is not None:
+            query += ' AND bucket >= ?'
+            params.append(since)
+        query += ' ORDER BY count DESC' if order_by == 'count' else ' ORDER BY bucket DESC'
+        query += ' LIMIT ?'
+        params.append(-1 if limit is None else limit)
+        return dict(self.reader().execute(query, params).fetchall())
+
+    def rebuild_report_counters(self):
+        """Recompute every report counter from the source tables."""
+        self.flush()
+        self.execute_batches([('DELETE FROM report_counters', [()])] + [
+            (f'INSERT INTO report_counters (metric, bucket, count) {report_rebuild_sql(metric)}', [()])
+            for metric in REPORT_METRICS
+        ])
+
+    def verify_report_counters(self):
+        """
+        Compare the counters against a full recount. Returns
+        {metric: {bucket: (stored, actual)}} for every bucket that differs.
+        """
+        self.flush()
+        cursor = self.reader().cursor()
+        mismatches = {}
+        for metric in REPORT_METRICS:
+            stored = dict(cursor.execute(
+                'SELECT bucket, count FROM report_counters WHERE metric = ? AND count != 0', (metric,)
+            ).fetchall())
+            actual = {bucket: count for _, bucket, count in cursor.execute(report_rebuild_sql(metric)).fetchall()}
+            diff = {bucket: (stored.get(bucket, 0), actual.get(bucket, 0))
+                    for bucket in stored.keys() | actual.keys() if stored.get(bucket, 0) != actual.get(bucket, 0)}
+            if diff:
+                mismatches[metric] = diff
+        return mismatches
+
+    # ---------------- Change Log ----------------
+    def get_change_seq(self):
+        """Return the sequence number of the latest website insert or content change."""
+        row = self.reader().execute('SELECT MAX(seq) FROM website_changes').fetchone()
+        return row[0] or 0
+
+    def iter_changed_websites(self, after=0, upto=None, chunk_size=1000, with_risk=False):
+        """
+        Yield lists of (seq, url, title, content) rows for websites changed
+        after sequence `after` (and up to `upto`), in sequence order; with
+        `with_risk`, rows also carry (type, risk_level). Rows are stepped
+        from one cursor, so the table is never loaded at once.
+        """
+        cursor = self.reader().cursor()
+        cursor.execute(f'''
+            SELECT c.seq, w.url, w.title, w.content{', w.type, w.risk_level' if with_risk else ''}
+            FROM website_changes c JOIN websites w ON w.rowid = c.website_id
+            WHERE c.seq > ? AND c.seq <= ?
+            ORDER BY c.seq
+        ''', (after, self.get_change_seq() if upto is None else upto))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+    def get_scan_state(self, name):
+        """Return (high_water, rules_fingerprint) for a scan job, or (0, None) if it never ran."""
+        row = self.reader().execute(
+            'SELECT high_water, rules_fingerprint FROM alert_scan_state WHERE name = ?', (name,)
+        ).fetchone()
+        return tuple(row) if row else (0, None)
+
+    # ---------------- Crawl State ----------------
+    def checkpoint_crawl(self, queued, visited):
+        """
+        Persist frontier progress in one transaction.
+        `queued` holds (url, depth, seed) rows newly added to the frontier and
+        `visited` holds (url, seed, status) rows that have left it.
+        """
+        # Pages written for these URLs must be durable before they count as visited
+        if not self.flush():
+            return False
+        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self.execute_batches([
+                ('INSERT OR IGNORE INTO crawl_frontier (url, depth, seed, date_added) VALUES (?, ?, ?, ?)',
+                 [(url, depth, seed, current_date) for url, depth, seed in queued]),
+                ('INSERT OR REPLACE INTO crawl_visited (url, seed, status, date_visited) VALUES (?, ?, ?, ?)',
+                 [(url, seed, status, current_date) for url, seed, status in visited]),
+                ('DELETE FROM crawl_frontier WHERE url = ?', [(url,) for url, _, _ in visited]),
+            ])
+            return True
+        except Exception as e:
+            print(f"[-] Error checkpointing crawl: {str(e)}")
+            return False
+
+    def get_crawl_frontier(self):
+        """Return the persisted (url, depth, seed) rows still waiting to be crawled."""
+        self.flush()
+        cursor = self.reader().cursor()
+        try:
+            cursor.execute('SELECT url, depth, seed FROM crawl_frontier ORDER BY rowid')
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"[-] Error retrieving crawl frontier: {str(e)}")
+            return []
+
+    def iter_crawl_visited(self, chunk_size=10000):
+        """Yield every visited URL without loading the whole table at once."""
+        self.flush()
+        cursor = self.reader().cursor()
+        cursor.execute('SELECT url FROM crawl_visited')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+
+    def get_crawl_page_counts(self):
+        """Return the number of successfully crawled pages per seed."""
+        self.flush()
+        cursor = self.reader().cursor()
+        try:
+            cursor.execute('''
+                SELECT seed, COUNT(*) FROM crawl_visited
+                WHERE status IN ('ok', 'unchanged')
+                GROUP BY seed
+            ''')
+            return dict(cursor.fetchall())
+        except Exception as e:
+            print(f"[-] Error retrieving crawl page counts: {str(e)}")
+            return {}
+
+    def clear_crawl_state(self):
+        try:
+            self.execute_batches([('DELETE FROM crawl_frontier', [()]), ('DELETE FROM crawl_visited', [()])])
+            return True
+        except Exception as e:
+            print(f"[-] Error clearing crawl state: {str(e)}")
+            return False
+
     # ---------------- Close Connection ----------------
     def close(self):
         if self.conn:
+            self.flush()
+            if self.writer_thread:
+                self.writer_thread.stop()
+                self.writer_thread = None
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns = []
             self.conn.close()
             print("[+] Database connection closed")
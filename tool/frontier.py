@@ -0,0 +1,139 @@
+import time
+import math
+import heapq
+import hashlib
+from collections import deque
+from urllib.parse import urlparse
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter for URL membership checks.
+
+    Uses about 1.2 bytes per URL at a 0.1% false-positive rate, against well
+    over 100 bytes per entry for a Python set. A false positive means a URL is
+    treated as already seen.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+
+class CrawlFrontier:
+    """
+    Crawl frontier with one FIFO queue per host.
+
+    URLs are de-duplicated when they are enqueued, and hosts are scheduled
+    from a heap keyed on the next time they may be fetched, so a slow host
+    only delays its own queue.
+    """
+
+    def __init__(self, host_delay=1.0, host_concurrency=1, seen=None):
+        self.host_delay = host_delay
+        self.host_concurrency = host_concurrency
+        self.host_delays = {}       # per-host overrides of host_delay
+        self.queues = {}            # host -> deque of (url, depth, seed)
+        self.seen = seen if seen is not None else set()
+        self.active = {}            # host -> fetches currently in flight
+        self.next_allowed = {}      # host -> earliest monotonic time for the next fetch
+        self._schedule = []         # heap of (ready_time, host)
+        self._scheduled = set()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def host_of(url):
+        return urlparse(url).netloc.lower()
+
+    def set_host_delay(self, host, delay):
+        """Override the politeness delay for a single host."""
+        self.host_delays[host] = delay
+
+    # ---------------- Enqueue ----------------
+    def add(self, url, depth, seed=None):
+        """Queue a URL unless it has been seen before. Returns True if it was queued."""
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        host = self.host_of(url)
+        self.queues.setdefault(host, deque()).append((url, depth, seed or url))
+        self._size += 1
+        self._maybe_schedule(host)
+        return True
+
+    def mark_seen(self, url):
+        """Record a URL as already handled without queueing it."""
+        self.seen.add(url)
+
+    # ---------------- Dispatch ----------------
+    def next(self):
+        """
+        Pop the next URL whose host is allowed to be fetched now.
+
+        Returns ((url, depth, seed), None) when a URL is ready, (None, seconds)
+        when the earliest host becomes ready after a wait, and (None, None)
+        when no host is schedulable until a fetch completes or a URL is added.
+        """
+        while self._schedule:
+            ready_time, host = self._schedule[0]
+            now = time.monotonic()
+            if ready_time > now:
+                return None, ready_time - now
+            heapq.heappop(self._schedule)
+            allowed = self.next_allowed.get(host, 0)
+            if ready_time < allowed:
+                # done() pushed the host back after this entry was queued; re-key it
+                heapq.heappush(self._schedule, (allowed, host))
+                continue
+            self._scheduled.discard(host)
+            queue = self.queues.get(host)
+            if not queue:
+                continue
+
+            entry = queue.popleft()
+            self._size -= 1
+            self.active[host] = self.active.get(host, 0) + 1
+            self.next_allowed[host] = now + self.host_delays.get(host, self.host_delay)
+            self._maybe_schedule(host)
+            return entry, None
+        return None, None
+
+    def done(self, url):
+        """Mark the fetch of `url` as finished so its host can be scheduled again."""
+        host = self.host_of(url)
+        self.active[host] = max(self.active.get(host, 1) - 1, 0)
+        # Politeness is measured from the end of the fetch, so slow hosts back off. A host
+        # already in the heap keeps its entry, which next() re-keys to this later time
+        delay = self.host_delays.get(host, self.host_delay)
+        self.next_allowed[host] = max(self.next_allowed.get(host, 0), time.monotonic() + delay)
+        self._maybe_schedule(host)
+
+    def _maybe_schedule(self, host):
+        if host in self._scheduled or not self.queues.get(host):
+            return
+        if self.active.get(host, 0) >= self.host_concurrency:
+            return
+        heapq.heappush(self._schedule, (self.next_allowed.get(host, 0), host))
+        self._scheduled.add(host)
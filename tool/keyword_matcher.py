@@ -0,0 +1,74 @@
+import re
+
+
+def _trie_pattern(words):
+    """
+    Compile words into a trie-shaped regex such as 'ca(?:rd(?:s)?|sh)'.
+    The regex engine then walks shared prefixes once instead of trying
+    every alternative at every position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != '']
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A word ends here but longer words continue, so the rest is optional
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive substring matcher for many keywords in one pass.
+
+    Gives the same answer as checking `keyword.lower() in text.lower()` for
+    every keyword. The cost grows with the text, not with the number of
+    keywords.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(keywords))
+        self._by_folded = {}
+        for keyword in self.keywords:
+            if keyword:
+                self._by_folded.setdefault(keyword.lower(), []).append(keyword)
+        # An empty keyword is a substring of everything
+        self._always = [keyword for keyword in self.keywords if not keyword]
+
+        folded = list(self._by_folded)
+        # Greedy matching reports the longest keyword at each position; the
+        # shorter ones starting there are its prefixes
+        self._prefixes = {word: [other for other in folded if word.startswith(other)] for word in folded}
+        self.pattern = re.compile('(?=(' + _trie_pattern(folded) + '))') if folded else None
+
+    def find(self, text):
+        """Return the set of keywords that occur in `text`."""
+        found = set(self._always)
+        if self.pattern is None or not text:
+            return found
+
+        hits = set()
+        for match in self.pattern.finditer(text.lower()):
+            word = match.group(1)
+            if word in hits:
+                continue
+            hits.update(self._prefixes[word])
+            if len(hits) == len(self._by_folded):
+                break
+        for word in hits:
+            found.update(self._by_folded[word])
+        return found
+
+    def matches(self, text):
+        """Return True if any keyword occurs in `text`."""
+        if self._always:
+            return True
+        return self.pattern is not None and bool(text) and self.pattern.search(text.lower()) is not None
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the openvpn binary, for exercising VPNManager and its
+rotation without a VPN provider. Point VPN_CONFIG['openvpn_path'] at this
+file (it must be executable). It accepts the same --config and
+--auth-user-pass options, prints an openvpn-style log ending in
+"Initialization Sequence Completed" and then stays up until terminated.
+
+The config file may contain these directives to script a scenario:
+
+    stub-connect-delay 2     seconds before the tunnel comes up
+    stub-fail                exit with an error instead of connecting
+    stub-hang                never finish initializing
+    stub-drop-after 30       exit this many seconds after connecting
+"""
+import sys
+import time
+import signal
+import argparse
+
+
+def read_directives(path):
+    directives = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if parts and parts[0].startswith('stub-'):
+                directives[parts[0]] = parts[1] if len(parts) > 1 else True
+    return directives
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--config', required=True)
+    parser.add_argument('--auth-user-pass')
+    args, _ = parser.parse_known_args()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        directives = read_directives(args.config)
+    except OSError as e:
+        print(f"Options error: cannot read config {args.config}: {e}", flush=True)
+        return 1
+
+    print(f"OpenVPN stub starting with {args.config}", flush=True)
+    print("TCP/UDP: Preserving recently used remote address: [AF_INET]127.0.0.1:1194", flush=True)
+    time.sleep(float(directives.get('stub-connect-delay', 0.5)))
+    if 'stub-fail' in directives:
+        print("AUTH: Received control message: AUTH_FAILED", flush=True)
+        return 1
+    if 'stub-hang' in directives:
+        while True:
+            time.sleep(60)
+
+    print("Initialization Sequence Completed", flush=True)
+    drop_after = directives.get('stub-drop-after')
+    if drop_after:
+        time.sleep(float(drop_after))
+        print("Connection reset, restarting [0]", flush=True)
+        return 1
+    while True:
+        time.sleep(60)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
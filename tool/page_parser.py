@@ -0,0 +1,52 @@
+import re
+from urllib.parse import urljoin, urldefrag
+from bs4 import BeautifulSoup
+
+# lxml is several times faster than the pure-Python parser; use it when installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+NON_VISIBLE_TAGS = ['script', 'style', 'noscript', 'template']
+
+PRICE_PATTERN = re.compile(r'(?:[$€£]\s?\d+(?:[.,]\d{2})?|\d+(?:\.\d+)?\s?(?:btc|xmr|usd)\b)', re.IGNORECASE)
+CART_PATTERN = re.compile(r'\b(?:add to cart|buy now|checkout|escrow|vendor)\b', re.IGNORECASE)
+FORUM_PATTERN = re.compile(r'\b(?:reply|replies|thread|posted by|topic)\b', re.IGNORECASE)
+CHAT_PATTERN = re.compile(r'\b(?:chat room|send message|online users|nickname)\b', re.IGNORECASE)
+
+
+def parse_page(html, url):
+    """
+    Parse a page once and extract everything the crawler needs from the tree.
+    Returns a dict with title, visible text, absolute outbound links,
+    (link, anchor text) pairs and page-type signals.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    title = soup.title.string.strip() if soup.title and soup.title.string else "No Title"
+
+    links = []
+    anchors = []
+    for anchor in soup.find_all('a', href=True):
+        absolute_url, _ = urldefrag(urljoin(url, anchor['href']))
+        links.append(absolute_url)
+        anchors.append((absolute_url, anchor.get_text().strip()))
+
+    signals = {
+        'forms': len(soup.find_all('form')),
+        'password_fields': len(soup.find_all('input', attrs={'type': 'password'})),
+    }
+
+    for tag in soup(NON_VISIBLE_TAGS):
+        tag.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+
+    signals.update({
+        'price_mentions': len(PRICE_PATTERN.findall(text)),
+        'cart_markers': len(CART_PATTERN.findall(text)),
+        'forum_markers': len(FORUM_PATTERN.findall(text)),
+        'chat_markers': len(CHAT_PATTERN.findall(text)),
+    })
+
+    return {'title': title, 'text': text, 'links': links, 'anchors': anchors, 'signals': signals}
@@ -0,0 +1,210 @@
+import time
+import threading
+import requests
+from collections import deque
+from contextlib import contextmanager
+from config import SEARCH_CONFIG
+
+
+def tor_target(port):
+    return f"tor:{port}"
+
+
+def vpn_target(config_path):
+    return f"vpn:{config_path}"
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class EgressStats:
+    """Rolling request samples of one egress: the last `size` requests within `max_age` seconds."""
+
+    def __init__(self, size=50, max_age=600):
+        self.samples = deque(maxlen=size)     # (finished at, latency, ok, bytes)
+        self.max_age = max_age
+
+    def add(self, latency, ok, nbytes=0):
+        self.samples.append((time.monotonic(), latency, ok, nbytes))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.max_age
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def summary(self):
+        samples = self._recent()
+        if not samples:
+            return {'samples': 0, 'error_rate': 0.0, 'latency_p50': None, 'latency_p90': None, 'throughput': 0.0}
+        latencies = [latency for _, latency, ok, _ in samples if ok]
+        span = max(samples[-1][0] - samples[0][0] + samples[0][1], 1e-6)
+        return {
+            'samples': len(samples),
+            'error_rate': sum(1 for _, _, ok, _ in samples if not ok) / len(samples),
+            'latency_p50': _percentile(latencies, 0.5) if latencies else None,
+            'latency_p90': _percentile(latencies, 0.9) if latencies else None,
+            'throughput': sum(nbytes for _, _, _, nbytes in samples) / span     # bytes per second
+        }
+
+
+class ProxyHealthMonitor:
+    """
+    Tracks rolling latency, error rate and throughput per egress (a Tor
+    instance or a VPN config) and demotes the ones that fail or lag.
+
+    An egress is demoted for `demote_for` seconds once it has `min_samples`
+    samples and either its error rate exceeds `max_error_rate` or its p90
+    latency is over `slow_factor` times the median p90 of the other
+    egresses (or over `max_latency`, when set). Demoted egresses are
+    skipped by selection; when the demotion runs out their samples are
+    cleared, so they come back on a clean slate.
+    """
+
+    def __init__(self, window=None, max_error_rate=None, slow_factor=None, max_latency=None,
+                 min_samples=None, demote_for=None):
+        health_config = SEARCH_CONFIG.get('proxy_health', {})
+        self.window = window or health_config.get('window', 50)
+        self.max_error_rate = max_error_rate if max_error_rate is not None else health_config.get('max_error_rate', 0.3)
+        self.slow_factor = slow_factor or health_config.get('slow_factor', 3.0)
+        self.max_latency = max_latency if max_latency is not None else health_config.get('max_latency')
+        self.min_samples = min_samples or health_config.get('min_samples', 5)
+        self.demote_for = demote_for or health_config.get('demote_for', 120)
+        self.targets = {}           # name -> proxy settings (None for a VPN, which needs none)
+        self.stats = {}             # name -> EgressStats
+        self.demoted = {}           # name -> monotonic time the demotion ends
+        self.lock = threading.Lock()
+
+    # ---------------- Targets ----------------
+    def register(self, name, proxy_settings=None):
+        with self.lock:
+            self.targets[name] = proxy_settings
+            self.stats.setdefault(name, EgressStats(self.window))
+
+    def unregister(self, name):
+        with self.lock:
+            self.targets.pop(name, None)
+            self.stats.pop(name, None)
+            self.demoted.pop(name, None)
+
+    def target_for(self, proxy_settings):
+        """Name of the registered egress with these proxy settings, if any."""
+        with self.lock:
+            for name, settings in self.targets.items():
+                if settings and settings == proxy_settings:
+                    return name
+        return None
+
+    # ---------------- Samples ----------------
+    def record(self, name, latency, ok, nbytes=0):
+        """Add one request's outcome; returns True if it got `name` demoted."""
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                return False
+            self._expire(name)
+            stats.add(latency, ok, nbytes)
+            if name in self.demoted:
+                return False
+            reason = self._demotion_reason(name)
+            if reason:
+                self.demoted[name] = time.monotonic() + self.demote_for
+                print(f"[-] Demoting {name} for {self.demote_for}s: {reason}")
+                return True
+        return False
+
+    @contextmanager
+    def timed(self, name):
+        """
+        Time the request made inside the block. It counts as failed if it
+        raises or its response (set with `sample['response'] = ...`) has a
+        5xx status.
+        """
+        sample = {'response': None}
+        start = time.monotonic()
+        try:
+            yield sample
+        except Exception:
+            self.record(name, time.monotonic() - start, False)
+            raise
+        response = sample['response']
+        ok = response is None or response.status_code < 500
+        self.record(name, time.monotonic() - start, ok, len(response.content) if response is not None else 0)
+
+    def probe(self, name, url="https://httpbin.org/ip", timeout=10):
+        """Time one request through `name` (a Tor target) and record it; returns success."""
+        session = requests.Session()
+        session.proxies = self.targets.get(name) or {}
+        try:
+            with self.timed(name) as sample:
+                sample['response'] = session.get(url, timeout=timeout)
+            return sample['response'].ok
+        except Exception:
+            return False
+        finally:
+            session.close()
+
+    # ---------------- Demotion ----------------
+    def _demotion_reason(self, name):
+        # Caller holds self.lock
+        summary = self.stats[name].summary()
+        if summary['samples'] < self.min_samples:
+            return None
+        if summary['error_rate'] > self.max_error_rate:
+            return f"error rate {summary['error_rate']:.0%}"
+        p90 = summary['latency_p90']
+        if p90 is None:
+            return None
+        if self.max_latency and p90 > self.max_latency:
+            return f"p90 latency {p90:.1f}s over {self.max_latency}s"
+        peers = [other.summary()['latency_p90'] for other_name, other in self.stats.items()
+                 if other_name != name and other_name not in self.demoted]
+        peers = [latency for latency in peers if latency is not None]
+        if peers:
+            baseline = _percentile(peers, 0.5)
+            if p90 > self.slow_factor * baseline:
+                return f"p90 latency {p90:.1f}s vs {baseline:.1f}s for its peers"
+        return None
+
+    def _expire(self, name):
+        # Caller holds self.lock
+        until = self.demoted.get(name)
+        if until is not None and time.monotonic() >= until:
+            del self.demoted[name]
+            self.stats[name] = EgressStats(self.window)
+            print(f"[+] {name} back in rotation")
+
+    def is_demoted(self, name):
+        with self.lock:
+            self._expire(name)
+            return name in self.demoted
+
+    def ranked(self, names=None):
+        """Healthy egresses, best first: lowest error rate, then lowest p50 latency."""
+        with self.lock:
+            names = [name for name in (names if names is not None else self.targets) if name in self.stats]
+            for name in names:
+                self._expire(name)
+            healthy = [name for name in names if name not in self.demoted]
+            summaries = {name: self.stats[name].summary() for name in healthy}
+        return sorted(healthy, key=lambda name: (
+            round(summaries[name]['error_rate'], 2),
+            summaries[name]['latency_p50'] if summaries[name]['latency_p50'] is not None else 0
+        ))
+
+    def best_proxy_settings(self, exclude=None):
+        """Proxy settings of the healthiest Tor egress other than `exclude`, or None."""
+        for name in self.ranked():
+            if name != exclude and self.targets.get(name):
+                return self.targets[name]
+        return None
+
+    def report(self):
+        """{name: rolling summary plus 'demoted'} for every egress."""
+        with self.lock:
+            for name in list(self.demoted):
+                self._expire(name)
+            return {name: {**stats.summary(), 'demoted': name in self.demoted}
+                    for name, stats in self.stats.items()}
@@ -0,0 +1,244 @@
+"""
+Score page content for risk on a 0-10 scale, many pages at a time.
+
+Words and word pairs are hashed into a fixed vector of term weights, so a
+batch is scored with a handful of array operations instead of a loop over
+the vocabulary. Only words and pairs whose full 64-bit hash is one of the
+weighted terms' are looked up, so bucket collisions cannot score benign
+text. The term score is combined with the alert rules that fire on the
+page and a prior for its page type. The crawler scores pages as it stores
+them; this module's CLI rescores the stored websites table.
+
+    python risk_scoring.py [--full] [--chunk-size N]
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from config import ALERT_CONFIG
+from alert_rules import AlertRuleEngine
+from database import DataBaseManager, SCAN_STATE_SQL
+
+# Term -> weight; ALERT_CONFIG['high_risk_keywords'] are added at HIGH_RISK_WEIGHT
+DEFAULT_RISK_TERMS = {
+    'weapons': 3.0, 'firearms': 3.0, 'explosives': 3.0, 'ammunition': 2.0,
+    'ransomware': 3.0, 'malware': 2.5, 'exploit': 2.5, 'zero day': 3.0, 'botnet': 2.5, 'ddos': 2.0,
+    'keylogger': 2.5, 'rat': 1.0, 'crypter': 2.5, 'phishing': 2.0,
+    'carding': 3.0, 'fullz': 3.0, 'cvv': 2.5, 'dumps': 1.5, 'credit card': 1.5, 'bank logs': 2.5,
+    'counterfeit': 2.0, 'fake passport': 3.0, 'fake id': 2.5, 'money laundering': 3.0,
+    'cocaine': 2.5, 'heroin': 3.0, 'fentanyl': 3.0, 'meth': 2.0, 'mdma': 2.0, 'drugs': 1.5,
+    'escrow': 1.0, 'vendor': 0.5, 'stealth shipping': 2.0, 'hitman': 3.0, 'leaked': 1.5,
+    'database dump': 2.5, 'stolen': 1.5, 'hacked accounts': 2.5,
+}
+HIGH_RISK_WEIGHT = 3.0
+
+DEFAULT_PAGE_TYPE_WEIGHTS = {'marketplace': 1.5, 'forum': 0.5, 'chat': 0.5, 'blog': 0.0, 'website': 0.0}
+
+# Polynomial hash base (odd, so invertible modulo 2**64) and the mixer of word pairs
+_BASE = 0x100000001B3
+_BASE_INVERSE = pow(_BASE, -1, 1 << 64)
+_PAIR_MIX = 0x9E3779B97F4A7C15
+
+# Bytes that make up a word: ASCII letters and digits, after lowercasing
+_WORD_BYTES = np.zeros(256, dtype=bool)
+_WORD_BYTES[np.frombuffer(b'abcdefghijklmnopqrstuvwxyz0123456789', dtype=np.uint8)] = True
+
+# Texts are hashed in slices of about this many bytes, bounding the temporary arrays
+_SLICE_BYTES = 1 << 20
+
+
+class RiskScorer:
+    """
+    Hashed term-weight risk model. ALERT_CONFIG['risk_scoring'] may set
+    'terms' (term -> weight, merged over DEFAULT_RISK_TERMS),
+    'page_type_weights', 'rule_weight' (points per rule severity point),
+    'term_points' (most points terms can give) and 'saturation' (term score
+    at which terms give about 63% of term_points).
+    """
+
+    def __init__(self, alert_config=None, rule_engine=None, dimensions=1 << 20):
+        alert_config = alert_config if alert_config is not None else ALERT_CONFIG
+        scoring = alert_config.get('risk_scoring', {})
+        self.rules = rule_engine or AlertRuleEngine(alert_config)
+        self.dimensions = dimensions
+        self.page_type_weights = {**DEFAULT_PAGE_TYPE_WEIGHTS, **scoring.get('page_type_weights', {})}
+        self.rule_weight = scoring.get('rule_weight', 0.3)
+        self.term_points = scoring.get('term_points', 7.0)
+        self.saturation = scoring.get('saturation', 4.0)
+
+        terms = dict(DEFAULT_RISK_TERMS)
+        terms.update({keyword.lower(): HIGH_RISK_WEIGHT for keyword in alert_config.get('high_risk_keywords', [])})
+        terms.update(scoring.get('terms', {}))
+        self._powers = np.ones(0, dtype=np.uint64)
+        self._inverse_powers = np.ones(0, dtype=np.uint64)
+        self.weights = np.zeros(dimensions, dtype=np.float32)
+        term_hashes = []
+        for term, weight in terms.items():
+            words, pairs, _, _ = self._hash_words([term])
+            # A phrase is matched through its word pairs, a single word through itself
+            hashes = pairs if len(pairs) else words
+            if len(hashes):
+                self.weights[hashes % np.uint64(dimensions)] += weight / len(hashes)
+                term_hashes.append(hashes)
+        self.term_hashes = np.unique(np.concatenate(term_hashes)) if term_hashes else np.zeros(0, dtype=np.uint64)
+        self.fingerprint = hashlib.sha256(json.dumps({
+            'terms': sorted(terms.items()), 'page_types': sorted(self.page_type_weights.items()),
+            'rule_weight': self.rule_weight, 'term_points': self.term_points, 'saturation': self.saturation,
+            'dimensions': dimensions, 'rules': self.rules.fingerprint
+        }).encode()).hexdigest()
+
+    def _power_tables(self, size):
+        if len(self._powers) < size:
+            size = max(size, _SLICE_BYTES + 1)
+            self._powers, self._inverse_powers = (
+                np.concatenate((np.ones(1, dtype=np.uint64), np.cumprod(np.full(size - 1, base, dtype=np.uint64))))
+                for base in (_BASE, _BASE_INVERSE)
+            )
+        return self._powers, self._inverse_powers
+
+    def _hash_words(self, texts):
+        """
+        Hash every word ([a-z0-9]+ after lowercasing) of `texts` with no
+        per-word Python work: a polynomial hash is prefix-summed over the
+        bytes and each word's hash is read off from its two ends. Returns
+        (word hashes, hashes of adjacent word pairs within a text, and the
+        text index of each).
+        """
+        data = '\n'.join(texts).lower().encode()
+        codes = np.frombuffer(data, dtype=np.uint8)
+        # Text i starts right after the i-th separator
+        text_starts = np.concatenate(([0], np.flatnonzero(codes == 10) + 1))
+        in_word = np.concatenate(([False], _WORD_BYTES[codes], [False]))
+        starts = np.flatnonzero(in_word[1:] & ~in_word[:-1])
+        ends = np.flatnonzero(in_word[:-1] & ~in_word[1:])
+        powers, inverse_powers = self._power_tables(len(codes) + 1)
+        prefix = np.zeros(len(codes) + 1, dtype=np.uint64)
+        np.cumsum(codes.astype(np.uint64) * powers[:len(codes)], out=prefix[1:])
+        words = (prefix[ends] - prefix[starts]) * inverse_powers[starts]
+        words ^= words >> np.uint64(31)
+        words *= np.uint64(_PAIR_MIX)
+        word_texts = np.searchsorted(text_starts, starts, side='right') - 1
+        same_text = word_texts[:-1] == word_texts[1:]
+        pairs = words[:-1][same_text] * np.uint64(_PAIR_MIX) + words[1:][same_text]
+        return words, pairs, word_texts, word_texts[:-1][same_text]
+
+    def term_scores(self, texts):
+        """Sum over matched terms of weight * (1 + log tf) for each text, as one sparse product."""
+        # A newline separates texts in the joined buffer, so it must not occur inside one
+        texts = [text.replace('\n', ' ') if text else '' for text in texts]
+        dimensions = np.uint64(self.dimensions)
+        keys = []
+        offset, index = 0, 0
+        while index < len(texts):
+            # Slice the batch so the hash arrays stay small
+            size, stop = 0, index
+            while stop < len(texts) and (stop == index or size + len(texts[stop]) <= _SLICE_BYTES):
+                size += len(texts[stop]) + 1
+                stop += 1
+            words, pairs, word_texts, pair_texts = self._hash_words(texts[index:stop])
+            hashes = np.concatenate((words, pairs))
+            docs = np.concatenate((word_texts, pair_texts)).astype(np.uint64) + np.uint64(index)
+            # Only the weighted terms themselves take part, which is a small fraction of a
+            # page's words; matching full hashes keeps other words out of their buckets
+            weighted = np.isin(hashes, self.term_hashes)
+            keys.append(docs[weighted] * dimensions + hashes[weighted] % dimensions)
+            index = stop
+        keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+        contributions = self.weights[keys % dimensions] * (1 + np.log(counts))
+        return np.bincount((keys // dimensions).astype(np.intp), weights=contributions, minlength=len(texts))
+
+    def score_batch(self, documents):
+        """
+        Score (text, page_type) pairs. Returns an int array of risk levels
+        from 0 to 10, one per document.
+        """
+        documents = list(documents)
+        if not documents:
+            return np.zeros(0, dtype=np.int64)
+        texts = [text or '' for text, _ in documents]
+        terms = self.term_points * (1 - np.exp(-self.term_scores(texts) / self.saturation))
+        rules = np.array([max((hit.severity for hit in self.rules.scan(text)), default=0) for text in texts],
+                         dtype=np.float64) * self.rule_weight
+        types = np.array([self.page_type_weights.get(page_type, 0.0) for _, page_type in documents])
+        return np.clip(np.rint(terms + rules + types), 0, 10).astype(np.int64)
+
+    def score(self, text, page_type=None):
+        return int(self.score_batch([(text, page_type)])[0])
+
+
+_default_scorer = None
+
+
+def default_scorer():
+    """Shared scorer built from the current ALERT_CONFIG."""
+    global _default_scorer
+    if _default_scorer is None:
+        _default_scorer = RiskScorer()
+    return _default_scorer
+
+
+class RiskRescorer:
+    """
+    Rescore the stored websites, in chunks, writing only changed risk
+    levels. Like the alert scan it tracks a high-water mark of the website
+    change log, so later runs score only new or changed pages, and it
+    rescores everything when the scoring model changes.
+    """
+
+    def __init__(self, db_manager, scorer=None, chunk_size=2000, name='risk_scores'):
+        self.db_manager = db_manager
+        self.scorer = scorer or default_scorer()
+        self.chunk_size = chunk_size
+        self.name = name
+
+    def run(self, full=False):
+        self.db_manager.flush()
+        high_water, fingerprint = self.db_manager.get_scan_state(self.name)
+        if full or fingerprint != self.scorer.fingerprint:
+            if fingerprint is not None and not full:
+                print("[*] Risk model changed since the last run; rescoring every page")
+            high_water = 0
+        upto = self.db_manager.get_change_seq()
+        if upto <= high_water:
+            print("[*] No new or changed pages to score")
+            return {'pages': 0, 'changed': 0}
+
+        stats = {'pages': 0, 'changed': 0}
+        start = time.perf_counter()
+        for rows in self.db_manager.iter_changed_websites(high_water, upto, self.chunk_size, with_risk=True):
+            scores = self.scorer.score_batch((f"{title or ''}\n{content or ''}", page_type)
+                                             for _, _, title, content, page_type, _ in rows)
+            updates = [(int(score), url) for score, (_, url, _, _, _, risk_level) in zip(scores, rows)
+                       if score != risk_level]
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            self.db_manager.execute_batches([
+                ('UPDATE websites SET risk_level = ? WHERE url = ?', updates),
+                (SCAN_STATE_SQL, [(self.name, rows[-1][0], self.scorer.fingerprint, now)]),
+            ])
+            stats['pages'] += len(rows)
+            stats['changed'] += len(updates)
+
+        elapsed = time.perf_counter() - start
+        print(f"[+] Scored {stats['pages']} pages in {elapsed:.1f}s "
+              f"({stats['pages'] / max(elapsed, 1e-9):.0f} pages/s), {stats['changed']} risk levels changed")
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--full', action='store_true', help="rescore every page, not only changed ones")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="pages scored per batch")
+    args = parser.parse_args()
+
+    db_manager = DataBaseManager()
+    try:
+        RiskRescorer(db_manager, chunk_size=args.chunk_size).run(full=args.full)
+    finally:
+        db_manager.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
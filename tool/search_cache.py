@@ -0,0 +1,155 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class SearchCache:
+    """
+    Result cache for SearchEngine queries with TTL expiry and LRU eviction.
+
+    Entries are keyed on the normalized query and its filters. With
+    `persistent`, entries are also written to the search_cache table so they
+    survive restarts. Entries are dropped as soon as the database reports a
+    change to a page inside their `sources` scope (any page when unscoped);
+    the matching deletes from the table are coalesced and written with the
+    next flush of the database's batched writer.
+    """
+
+    def __init__(self, db_manager, max_entries=256, ttl=300, persistent=False):
+        self.db_manager = db_manager
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persistent = persistent
+        self.entries = OrderedDict()    # key -> (expires_at, sources, has_date_filter, results)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()    # crawler threads invalidate while search threads read
+        self._stale = {}                # url -> True if its content changed, False if only last_seen
+        self._disk_empty = persistent and db_manager.reader().execute(
+            'SELECT 1 FROM search_cache LIMIT 1').fetchone() is None     # skips deletes while nothing is stored
+        db_manager.add_website_listener(self.invalidate)
+        db_manager.add_flush_listener(self._stale_deletes)
+
+    @staticmethod
+    def make_key(keywords, sources=None, geo_filter=None, date_filter=None, limit=None):
+        """Build a cache key that ignores keyword order, case and duplicates."""
+        return json.dumps({
+            'keywords': sorted({keyword.strip().lower() for keyword in keywords}),
+            'sources': sorted(set(sources)) if sources else None,
+            'geo_filter': geo_filter,
+            'date_filter': date_filter,
+            'limit': limit,
+        }, sort_keys=True)
+
+    # ---------------- Lookup ----------------
+    def get(self, key):
+        """Return cached results for `key`, or None on a miss."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[3]
+                del self.entries[key]
+            stale = bool(self._stale)
+
+        if self.persistent:
+            if stale:
+                # Stored entries of changed pages are only deleted on the next flush
+                self.db_manager.flush()
+            entry = self._load(key, now)
+            if entry is not None:
+                with self.lock:
+                    self._remember(key, entry)
+                    self.hits += 1
+                return entry[3]
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, results, sources=None, date_filter=None):
+        entry = (time.time() + self.ttl, frozenset(sources) if sources else None, bool(date_filter), results)
+        with self.lock:
+            self._remember(key, entry)
+            self._disk_empty = False
+        if self.persistent:
+            try:
+                self.db_manager.execute_batches([(
+                    'INSERT OR REPLACE INTO search_cache (cache_key, sources, has_date_filter, results, expires_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(key, json.dumps(sorted(entry[1])) if entry[1] else None, int(entry[2]),
+                      json.dumps(results), entry[0])]
+                )])
+            except Exception as e:
+                print(f"[-] Error persisting search cache entry: {str(e)}")
+
+    def _remember(self, key, entry):
+        # Caller holds self.lock
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _load(self, key, now):
+        try:
+            row = self.db_manager.reader().execute(
+                'SELECT sources, has_date_filter, results, expires_at FROM search_cache '
+                'WHERE cache_key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+        except Exception as e:
+            print(f"[-] Error reading search cache: {str(e)}")
+            return None
+        if not row:
+            return None
+        sources, has_date_filter, results, expires_at = row
+        return (expires_at, frozenset(json.loads(sources)) if sources else None,
+                bool(has_date_filter), json.loads(results))
+
+    # ---------------- Invalidation ----------------
+    def invalidate(self, urls, content_changed=True):
+        """
+        Drop entries whose scope covers any of `urls`. A last_seen-only change
+        can only alter date-filtered results, so other entries are kept.
+        """
+        urls = set(urls)
+        with self.lock:
+            stale = [
+                key for key, (_, sources, has_date_filter, _) in self.entries.items()
+                if (content_changed or has_date_filter) and (sources is None or not urls.isdisjoint(sources))
+            ]
+            for key in stale:
+                del self.entries[key]
+            if self.persistent and not self._disk_empty:
+                for url in urls:
+                    self._stale[url] = content_changed or self._stale.get(url, False)
+
+    def _stale_deletes(self):
+        """Flush listener: one batch of deletes for every url invalidated since the last flush."""
+        with self.lock:
+            stale, self._stale = self._stale, {}
+        if not stale:
+            return []
+        statements = []
+        for content_changed in (True, False):
+            urls = [url for url, changed in stale.items() if changed == content_changed]
+            if not urls:
+                continue
+            # A last_seen-only change can only alter date-filtered results
+            date_clause = '' if content_changed else 'has_date_filter = 1 AND '
+            statements.append((f'DELETE FROM search_cache WHERE {date_clause}sources IS NULL', ()))
+            statements.extend((f'DELETE FROM search_cache WHERE {date_clause}'
+                               'EXISTS (SELECT 1 FROM json_each(search_cache.sources) WHERE value = ?)', (url,))
+                              for url in urls)
+        return statements
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self._stale.clear()
+            self._disk_empty = True
+        if self.persistent:
+            self.db_manager.execute_batches([('DELETE FROM search_cache', [()])])
@@ -1,13 +1,24 @@
 import time
 import requests
-from bs4 import BeautifulSoup  # for parsing HTML
+from datetime import datetime, timedelta
 from config import SEARCH_CONFIG, ALERT_CONFIG
+from crawler import DarkWebCrawler
+from keyword_matcher import KeywordMatcher
+from page_parser import parse_page
+from search_cache import SearchCache
 
 class SearchEngine:
     def __init__(self, db_manager, alert_system):
         self.db_manager = db_manager
         self.alert_system = alert_system
         self.session = None
+        self.proxy_pool = None
+        self.cache = SearchCache(
+            db_manager,
+            max_entries=SEARCH_CONFIG.get('cache_size', 256),
+            ttl=SEARCH_CONFIG.get('cache_ttl', 300),
+            persistent=SEARCH_CONFIG.get('cache_persistent', False)
+        )
 
     def set_proxy(self, proxy_settings=None):
         self.session = requests.Session()
@@ -15,53 +26,174 @@ class SearchEngine:
             self.session.proxies = proxy_settings
         else:
             self.session.proxies = {'http': "socks5h://127.0.0.1:9050", 'https': "socks5h://127.0.0.1:9050"}
+        self.proxy_pool = None
         print(f"[+] Proxy set: {self.session.proxies}")
 
-    def search(self, keywords, sources=None, geo_filter=None, date_filter=None):
+    def set_proxy_pool(self, pool):
+        """Fetch through a browser_manager.TorPool, leasing an instance per request."""
+        self.session = requests.Session()
+        self.proxy_pool = pool
+        print(f"[+] Proxy pool set: {len(pool.instances)} Tor instances ({pool.strategy})")
+
+    def _get(self, url, **kwargs):
+        if self.proxy_pool:
+            with self.proxy_pool.lease() as proxies:
+                return self.session.get(url, proxies=proxies, **kwargs)
+        return self.session.get(url, **kwargs)
+
+    def search(self, keywords, sources=None, geo_filter=None, date_filter=None, refresh_stale=False, limit=100,
+               use_cache=True):
+        """
+        Search the content already stored by the crawler, answered locally from
+        the full-text index. With `refresh_stale`, pages not seen recently are
+        re-fetched over the proxy first. Repeated queries are served from the
+        result cache, which skips storing results and re-raising alerts.
+        """
+        if refresh_stale:
+            self.refresh_stale_pages()
+
+        key = SearchCache.make_key(keywords, sources, geo_filter, date_filter, limit) if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                print(f"[+] Found {len(cached)} results (cached)")
+                # Callers may edit their results; the cached ones must stay as stored
+                return [dict(result) for result in cached]
+
+        results = self._collect(self.iter_search(keywords, sources, geo_filter, date_filter, limit=limit))
+        if key is not None:
+            self.cache.put(key, [dict(result) for result in results], sources, date_filter)
+        return results
+
+    def iter_search(self, keywords, sources=None, geo_filter=None, date_filter=None, refresh_stale=False, limit=100):
+        """
+        Stream local search results. Each (keyword, url) result is yielded,
+        stored and checked for alerts exactly once, as it is found.
+        """
+        if refresh_stale:
+            self.refresh_stale_pages()
+
+        print(f"[+] Searching for keywords: {', '.join(keywords)}")
+        seen = set()
+        try:
+            for keyword in dict.fromkeys(keywords):
+                count = 0
+                for row in self.db_manager.search_content(keyword, sources=sources, since=date_filter, limit=limit):
+                    result = {
+                        "keyword": keyword,
+                        "url": row['url'],
+                        "title": row['title'],
+                        "snippet": row['snippet'],
+                        "source": row['url'],
+                        "date": row['last_seen'],
+                        "relevance": round(row['relevance'], 4),
+                        "geo_location": row['geo_location']
+                    }
+                    if geo_filter and not self._matches_geo_filter(result, geo_filter):
+                        continue
+                    if self._ingest(result, seen):
+                        count += 1
+                        yield result
+                self.alert_system.check_keyword_risk(keyword, count)
+        finally:
+            self.db_manager.flush()
+
+    def refresh_stale_pages(self, max_age_days=None):
+        """Incrementally re-fetch stored pages whose last_seen is older than `max_age_days`."""
         if not self.session:
             print("[-] No proxy configured. Connect to Tor first.")
             return []
 
+        max_age_days = max_age_days or SEARCH_CONFIG.get('stale_after_days', 7)
+        before = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d")
+        stale_urls = self.db_manager.get_stale_urls(before)
+        if not stale_urls:
+            return []
+
+        print(f"[+] Refreshing {len(stale_urls)} stale pages")
+        crawler = DarkWebCrawler(self.db_manager)
+        if self.proxy_pool:
+            crawler.set_proxy_pool(self.proxy_pool)
+        else:
+            crawler.set_proxy(self.session.proxies)
+        try:
+            return crawler.recrawl(stale_urls, max_pages=1)
+        finally:
+            crawler.close()
+
+    def search_live(self, keywords, sources=None, geo_filter=None, date_filter=None):
+        """Search link text on every known page by fetching it live over the proxy."""
+        if not self.session:
+            print("[-] No proxy configured. Connect to Tor first.")
+            return []
+        return self._collect(self.iter_search_live(keywords, sources, geo_filter, date_filter))
+
+    def iter_search_live(self, keywords, sources=None, geo_filter=None, date_filter=None):
+        """
+        Stream live search results. Each page is fetched and parsed once, all
+        keywords are matched against each link in a single pass, and every
+        (keyword, url) result is yielded, stored and alert-checked once.
+        """
+        if not self.session:
+            print("[-] No proxy configured. Connect to Tor first.")
+            return
+
         print(f"[+] Searching for keywords: {', '.join(keywords)}")
-        results = []
+        matcher = KeywordMatcher(keywords)
+        counts = {keyword: 0 for keyword in matcher.keywords}
+        seen = set()
 
-        # Get URLs from DB or crawler
-        urls_to_search = self.db_manager.get_all_urls()  # You must implement this DB method
+        urls_to_search = self.db_manager.get_all_urls()
+        if sources:
+            urls_to_search = [url for url in urls_to_search if url in sources]
 
-        for keyword in keywords:
+        try:
             for url in urls_to_search:
                 try:
-                    response = self.session.get(url, timeout=SEARCH_CONFIG['timeout'])
+                    response = self._get(url, timeout=SEARCH_CONFIG['timeout'])
                     response.raise_for_status()
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    for link in soup.find_all("a", href=True):
-                        if keyword.lower() in link.text.lower():
-                            result = {
-                                "url": link['href'],
-                                "title": link.text.strip(),
-                                "snippet": link.text.strip(),
-                                "source": url,
-                                "date": time.strftime("%Y-%m-%d")
-                            }
-                            if geo_filter and not self._matches_geo_filter(result, geo_filter):
-                                continue
-                            if date_filter and not self._matches_date_filter(result, date_filter):
-                                continue
-                            if sources and result['source'] not in sources:
-                                continue
-                            results.append(result)
-                    # Store results
-                    for result in results:
-                        self.db_manager.store_search_result(
-                            keyword, result['source'], result['url'],
-                            result['title'], result['snippet'], result['date']
-                        )
-                    # Check alerts
-                    self.alert_system.check_keyword_alerts(keyword, results)
+                    anchors = parse_page(response.content, url)['anchors']
                 except Exception as e:
                     print(f"[-] Error accessing {url}: {e}")
                     continue
 
+                for href, text in anchors:
+                    for keyword in matcher.find(text):
+                        result = {
+                            "keyword": keyword,
+                            "url": href,
+                            "title": text,
+                            "snippet": text,
+                            "source": url,
+                            "date": time.strftime("%Y-%m-%d")
+                        }
+                        if geo_filter and not self._matches_geo_filter(result, geo_filter):
+                            continue
+                        if date_filter and not self._matches_date_filter(result, date_filter):
+                            continue
+                        if self._ingest(result, seen):
+                            counts[keyword] += 1
+                            yield result
+
+            for keyword, count in counts.items():
+                self.alert_system.check_keyword_risk(keyword, count)
+        finally:
+            self.db_manager.flush()
+
+    def _ingest(self, result, seen):
+        """Store and alert-check a result the first time its (keyword, url) is seen."""
+        key = (result['keyword'], result['url'])
+        if key in seen:
+            return False
+        seen.add(key)
+        self.db_manager.store_search_result(
+            result['keyword'], result['url'], result['title'], result['snippet'],
+            result.get('relevance', 0), defer=True
+        )
+        self.alert_system.check_result_alerts(result)
+        return True
+
+    def _collect(self, results):
         # Deduplicate by URL
         unique_results = {r['url']: r for r in results}.values()
         print(f"[+] Found {len(unique_results)} results")
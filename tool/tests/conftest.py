@@ -0,0 +1,42 @@
+import os
+import sys
+import types
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    # config.py is deployment-specific and not in the repository; tests run against defaults
+    config = types.ModuleType('config')
+    config.DATABASE_CONFIG = {
+        'path': ':memory:',
+        'tables': {
+            'websites': '''CREATE TABLE IF NOT EXISTS websites (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT UNIQUE, title TEXT, content TEXT, type TEXT,
+                first_seen TEXT, last_seen TEXT, geo_location TEXT, risk_level INTEGER)''',
+            'users': '''CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, pgp_key TEXT, email TEXT,
+                marketplaces TEXT, products TEXT, last_active TEXT, geo_location TEXT, risk_level INTEGER)''',
+            'search_results': '''CREATE TABLE IF NOT EXISTS search_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, keyword TEXT, url TEXT, title TEXT, snippet TEXT,
+                relevance INTEGER, date_found TEXT)''',
+            'alerts': '''CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, content TEXT, severity INTEGER,
+                date_created TEXT, status TEXT)''',
+        }
+    }
+    config.SEARCH_CONFIG = {'timeout': 30}
+    config.ALERT_CONFIG = {'high_risk_keywords': ['weapons', 'exploit', 'ransomware'],
+                           'severity_levels': {'low': 3, 'medium': 5, 'high': 8}}
+    config.VPN_CONFIG = {'openvpn_path': '/usr/sbin/openvpn', 'configs': []}
+    sys.modules['config'] = config
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    from database import DataBaseManager
+    manager = DataBaseManager(str(tmp_path / 'test.db'), write_behind=False)
+    yield manager
+    manager.close()
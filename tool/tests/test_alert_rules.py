@@ -0,0 +1,54 @@
+import time
+import pytest
+from alert_rules import AlertRuleEngine, DEFAULT_PATTERN_RULES
+
+
+def test_many_literal_gated_rules_compile_quickly():
+    rules = {f'rule{i}': {'pattern': rf'tag{i}:\d+', 'requires': f'tag{i}:'} for i in range(16)}
+    start = time.perf_counter()
+    engine = AlertRuleEngine({'pattern_rules': rules})
+    assert time.perf_counter() - start < 1
+    assert sorted(hit.rule for hit in engine.scan("tag3:42 and tag11:7 but not tag5")) == ['rule11', 'rule3']
+
+
+def test_ungated_and_gated_rules_both_fire():
+    engine = AlertRuleEngine({})
+    hits = {hit.rule: hit.match for hit in engine.scan("card 4111 1111 1111 1111, mail a@b.org, ssn 123-45-6789")}
+    assert hits == {'credit_card': '4111 1111 1111 1111', 'email': 'a@b.org', 'ssn': '123-45-6789'}
+    assert engine.scan("no email here") == []
+
+
+@pytest.mark.parametrize('pattern', [r'(a)\1', r'(?P<x>a)(?P=x)', r'(?i)secret'])
+def test_uncombinable_patterns_are_rejected(pattern):
+    with pytest.raises(ValueError):
+        AlertRuleEngine({'pattern_rules': {'bad': pattern}})
+
+
+def test_scoped_flags_and_escaped_backslashes_are_allowed():
+    engine = AlertRuleEngine({'pattern_rules': {'scoped': r'(?i:secret)', 'path': r'c:\\1'}})
+    assert {hit.rule for hit in engine.scan(r"SECRET at c:\1")} == {'scoped', 'path'}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('foo123bar', {'prefix': 'foo123', 'suffix': '123bar'}),
+    ('abcd', {'short': 'abc', 'long': 'abcd'}),
+])
+def test_overlapping_matches_are_reported_for_each_rule(text, expected):
+    engine = AlertRuleEngine({'pattern_rules': {
+        'prefix': r'foo\d+', 'suffix': r'\d+bar', 'short': 'abc', 'long': 'abcd',
+    }})
+    assert {hit.rule: hit.match for hit in engine.scan(text)} == expected
+
+
+def test_span_rejected_by_a_validator_is_rescanned_for_other_rules():
+    engine = AlertRuleEngine({'pattern_rules': {
+        'card': {'pattern': r'\b\d{4} \d{4} \d{4} \d{4}\b', 'validator': 'luhn'},
+        'pin': r'\b\d{4}\b',
+    }})
+    assert {hit.rule: hit.match for hit in engine.scan('1234 5678 9012 3456')} == {'pin': '1234'}
+
+
+def test_reload_without_a_config_file_uses_the_loaded_config():
+    engine = AlertRuleEngine()
+    engine.reload()
+    assert engine.rule_names == list(DEFAULT_PATTERN_RULES)
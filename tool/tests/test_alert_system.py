@@ -0,0 +1,16 @@
+from alert_aggregator import AlertAggregator
+from alert_system import AlertSystem
+
+
+def test_repeats_are_written_as_one_delta_per_incident(db_manager):
+    alerts = AlertSystem(db_manager, aggregator=AlertAggregator(rate=0, burst=1, flush_interval=3600))
+    for _ in range(100):
+        alerts.create_alert("Suspicious content detected", "card found", 7, url="http://a.onion/x", rule="card")
+    for page in range(5):
+        alerts.create_alert("Suspicious content detected", "card found", 7, url=f"http://a.onion/{page}", rule="card")
+    # Only the first hit reached the writer; the rest are counts held by the aggregator
+    assert db_manager.writer.pending == 1
+
+    db_manager.flush()
+    rows = db_manager.reader().execute('SELECT type, hit_count FROM alerts ORDER BY hit_count').fetchall()
+    assert rows == [("Alert rate limit exceeded", 5), ("Suspicious content detected", 100)]
@@ -0,0 +1,55 @@
+from alias_clusters import AliasClusterer
+from database import DataBaseManager
+
+
+def store(db_manager, username, pgp_key=None, email=None):
+    db_manager.store_user(username, pgp_key, email, [], [], None)
+
+
+def test_pending_users_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'aliases.db')
+    db_manager = DataBaseManager(path, write_behind=False)
+    store(db_manager, 'darkvendor')
+    AliasClusterer(db_manager).rebuild()
+    store(db_manager, 'darkvendor1')
+    store(db_manager, 'someone', email='x@y.z')
+    store(db_manager, 'other', email='x@y.z')
+    db_manager.close()
+
+    # A new process never saw the stores above; the queue lives in the database
+    db_manager = DataBaseManager(path, write_behind=False)
+    try:
+        clusterer = AliasClusterer(db_manager)
+        assert clusterer.apply_pending() == 3
+        assert clusterer.get_cluster('darkvendor1') == ['darkvendor', 'darkvendor1']
+        assert clusterer.get_cluster('other') == ['other', 'someone']
+        assert clusterer.apply_pending() == 0
+    finally:
+        db_manager.close()
+
+
+def test_changed_user_is_requeued(db_manager):
+    store(db_manager, 'alpha')
+    store(db_manager, 'omega')
+    clusterer = AliasClusterer(db_manager)
+    clusterer.rebuild()
+    assert clusterer.apply_pending() == 0
+    store(db_manager, 'omega', pgp_key='KEY')
+    store(db_manager, 'alpha', pgp_key='KEY')
+    assert clusterer.get_cluster('alpha') == ['alpha', 'omega']
+
+
+def test_changed_identifier_unlinks_user(db_manager):
+    store(db_manager, 'alpha', pgp_key='K')
+    store(db_manager, 'omega', pgp_key='K')
+    store(db_manager, 'zulu', email='z@x.y')
+    store(db_manager, 'yankee', email='z@x.y')
+    clusterer = AliasClusterer(db_manager)
+    clusterer.rebuild()
+    store(db_manager, 'omega', pgp_key='OTHER', email='z@x.y')
+    assert clusterer.get_cluster('alpha') == ['alpha']
+    assert clusterer.get_cluster('omega') == ['omega', 'yankee', 'zulu']
+
+    incremental = clusterer.get_clusters(min_size=1)
+    clusterer.rebuild()
+    assert clusterer.get_clusters(min_size=1) == incremental
@@ -0,0 +1,60 @@
+import socket
+from browser_manager import BrowserManager, TorPool
+from crawler import DarkWebCrawler
+from proxy_health import ProxyHealthMonitor, tor_target
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_probe_exits_records_failed_probes():
+    manager = BrowserManager()
+    port = _closed_port()
+    manager.health.register(tor_target(port), {'http': f'socks5h://127.0.0.1:{port}',
+                                               'https': f'socks5h://127.0.0.1:{port}'})
+    report = manager.probe_exits(rounds=2, url='http://127.0.0.1:9/')
+    assert report[tor_target(port)]['samples'] == 2
+    assert report[tor_target(port)]['error_rate'] == 1.0
+
+
+def _demote(monitor, name):
+    for _ in range(monitor.min_samples):
+        monitor.record(name, 1.0, False)
+    assert monitor.is_demoted(name)
+
+
+def test_lease_skips_demoted_instances():
+    monitor = ProxyHealthMonitor(min_samples=2)
+    pool = TorPool(3, socks_port=19050, control_port=19051, monitor=monitor)
+    for instance in pool.instances:
+        instance.healthy = True
+        monitor.register(tor_target(instance.socks_port), instance.proxies())
+    demoted = pool.instances[1]
+    _demote(monitor, tor_target(demoted.socks_port))
+
+    leased = []
+    for _ in range(6):
+        with pool.lease() as proxies:
+            leased.append(proxies)
+    assert {proxies['http'] for proxies in leased} == {pool.instances[0].proxies()['http'],
+                                                       pool.instances[2].proxies()['http']}
+
+
+def test_failover_moves_the_crawler_to_a_healthy_instance(db_manager):
+    monitor = ProxyHealthMonitor(min_samples=2)
+    pool = TorPool(2, socks_port=19060, control_port=19061)
+    slow, healthy = (instance.proxies() for instance in pool.instances)
+    monitor.register(tor_target(19060), slow)
+    monitor.register(tor_target(19062), healthy)
+    crawler = DarkWebCrawler(db_manager)
+    crawler.set_proxy(slow)
+    crawler.set_health_monitor(monitor)
+
+    crawler._failover()
+    assert crawler.proxy_settings == slow
+    _demote(monitor, tor_target(19060))
+    crawler._failover()
+    assert crawler.proxy_settings == healthy
@@ -0,0 +1,82 @@
+from crawler import DarkWebCrawler
+
+PAGES = {
+    'http://seed.onion/': b'<html><title>Seed</title><a href="http://child.onion/">child</a></html>',
+    'http://child.onion/': b'<html><title>Child</title>leaf</html>',
+}
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.content = body
+        self.status_code = status_code
+        self.headers = {'ETag': 'v1'}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, timeout=None, headers=None, proxies=None):
+        self.requests.append(url)
+        if headers and headers.get('If-None-Match') == 'v1':
+            return FakeResponse(b'', 304)
+        return FakeResponse(PAGES[url])
+
+    def close(self):
+        pass
+
+
+def crawl(db_manager, **kwargs):
+    crawler = DarkWebCrawler(db_manager, concurrency=1)
+    crawler.crawl_delay = 0
+    crawler.set_proxy({'http': 'socks5h://127.0.0.1:9050'})
+    crawler.session = FakeSession()
+    crawler.crawl(['http://seed.onion/'], depth=1, resume=False, **kwargs)
+    return crawler
+
+
+def test_unchanged_pages_still_lead_to_their_links(db_manager):
+    crawl(db_manager)
+    crawler = crawl(db_manager, incremental=True)
+    assert crawler.session.requests == ['http://seed.onion/', 'http://child.onion/']
+    assert crawler.unchanged_count == 2
+
+
+class TrackedSession(FakeSession):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_replaced_session_closes_after_its_fetches(db_manager):
+    crawler = DarkWebCrawler(db_manager, concurrency=2)
+    crawler.session = old = TrackedSession()
+    with crawler._use_session() as in_flight:
+        crawler.close()
+        assert in_flight is old and not old.closed
+        crawler.session = new = TrackedSession()
+        with crawler._use_session() as other:
+            assert other is new
+    assert old.closed and not new.closed
+
+
+def paused_crawl(db_manager):
+    db_manager.checkpoint_crawl([('http://left.onion/', 1, 'http://left.onion/')],
+                                [('http://done.onion/', 'http://left.onion/', 'ok')])
+
+
+def test_recrawl_leaves_a_paused_crawl_alone(db_manager):
+    paused_crawl(db_manager)
+    crawler = DarkWebCrawler(db_manager, concurrency=1)
+    crawler.crawl_delay = 0
+    crawler.set_proxy({'http': 'socks5h://127.0.0.1:9050'})
+    crawler.session = FakeSession()
+    crawler.recrawl(['http://seed.onion/'], depth=1)
+    assert crawler.session.requests == ['http://seed.onion/', 'http://child.onion/']
+    assert db_manager.get_crawl_frontier() == [('http://left.onion/', 1, 'http://left.onion/')]
+    assert list(db_manager.iter_crawl_visited()) == ['http://done.onion/']
@@ -0,0 +1,71 @@
+import sqlite3
+import pytest
+
+
+@pytest.mark.parametrize('keyword, expected', [
+    ('100%', ['http://percent.onion/']),
+    ('a_b', ['http://underscore.onion/']),
+    ('c:\\d', ['http://backslash.onion/']),
+])
+def test_like_fallback_matches_wildcards_literally(db_manager, keyword, expected):
+    db_manager.has_fulltext_index = lambda: False
+    for url, content in [('http://percent.onion/', 'refund 100% guaranteed'), ('http://plain.onion/', '1000 items'),
+                         ('http://underscore.onion/', 'file a_b here'), ('http://other.onion/', 'file axb here'),
+                         ('http://backslash.onion/', 'path c:\\d'), ('http://slashless.onion/', 'path c:d')]:
+        db_manager.store_website(url, 'page', content, 'website', 'Unknown')
+    assert [result['url'] for result in db_manager.search_content(keyword)] == expected
+
+
+@pytest.fixture
+def write_behind_db(tmp_path):
+    from database import DataBaseManager
+    manager = DataBaseManager(str(tmp_path / 'write_behind.db'), write_behind=True)
+    yield manager
+    manager.close()
+
+
+def test_transaction_runs_on_the_writer_thread(write_behind_db):
+    write_behind_db.store_website('http://a.onion/', 'a', 'queued first', 'website', 'Unknown', defer=True)
+    write_behind_db.writer.flush(wait=False)
+    with write_behind_db.transaction() as cursor:
+        # Batches queued before the transaction are already committed
+        assert cursor.execute('SELECT COUNT(*) FROM websites').fetchone()[0] == 1
+        cursor.execute("UPDATE websites SET title = 'b' WHERE url = 'http://a.onion/'")
+    with pytest.raises(RuntimeError):
+        with write_behind_db.transaction() as cursor:
+            cursor.execute("UPDATE websites SET title = 'c'")
+            raise RuntimeError
+    assert write_behind_db.reader().execute('SELECT title FROM websites').fetchall() == [('b',)]
+
+
+def test_reads_see_buffered_and_in_flight_writes(write_behind_db):
+    write_behind_db.store_page_fingerprint('http://a.onion/', 'v1', None, 'h', links=['http://b.onion/'], defer=True)
+    assert write_behind_db.get_page_fingerprint('http://a.onion/')['links'] == ['http://b.onion/']
+    write_behind_db.store_page_fingerprint('http://c.onion/', 'v2', None, 'h', defer=True)
+    write_behind_db.writer.flush(wait=False)
+    assert write_behind_db.get_page_fingerprint('http://c.onion/')['etag'] == 'v2'
+    write_behind_db.writer.add('INSERT INTO crawl_frontier (url, depth, seed) VALUES (?, ?, ?)',
+                               ('http://d.onion/', 1, 'http://a.onion/'))
+    assert write_behind_db.get_crawl_frontier() == [('http://d.onion/', 1, 'http://a.onion/')]
+
+
+def test_failed_commit_resolves_every_waiter(write_behind_db):
+    from concurrent.futures import Future
+    from database import WriteBehindThread
+
+    class BrokenConnection:
+        in_transaction = False
+
+        def execute(self, sql):
+            raise sqlite3.OperationalError("database is locked")
+
+    futures = [Future(), Future()]
+    WriteBehindThread._commit(write_behind_db.writer_thread, BrokenConnection(),
+                              [([('SELECT 1', [()])], future) for future in futures])
+    assert all(isinstance(future.exception(timeout=1), sqlite3.OperationalError) for future in futures)
+
+
+def test_report_counts_include_buffered_writes(write_behind_db):
+    write_behind_db.store_website('http://a.onion/', 'a', 'x', 'forum', 'Unknown', defer=True)
+    write_behind_db.store_website('http://b.onion/', 'b', 'x', 'forum', 'Unknown', defer=True)
+    assert write_behind_db.get_report_counts('website_type') == {'forum': 2}
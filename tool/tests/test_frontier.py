@@ -0,0 +1,16 @@
+import time
+from frontier import CrawlFrontier
+
+
+def test_done_pushes_back_a_host_that_is_already_scheduled():
+    frontier = CrawlFrontier(host_delay=0.2, host_concurrency=2)
+    for page in range(3):
+        frontier.add(f'http://slow.onion/{page}', 0)
+    first, _ = frontier.next()
+    time.sleep(0.25)
+    # The second URL was scheduled at dispatch of the first; completing a slow fetch must delay it
+    frontier.done(first[0])
+    entry, wait = frontier.next()
+    assert entry is None and 0.15 < wait <= 0.2
+    time.sleep(wait)
+    assert frontier.next()[0][0] == 'http://slow.onion/1'
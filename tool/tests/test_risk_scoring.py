@@ -0,0 +1,22 @@
+import random
+from risk_scoring import RiskScorer, DEFAULT_RISK_TERMS
+
+BENIGN_WORDS = ('the garden club meets every tuesday to discuss roses tomatoes compost weather '
+                'recipes library books music concerts school homework bicycle repairs').split()
+
+
+def test_benign_text_scores_zero():
+    scorer = RiskScorer({}, dimensions=1 << 10)
+    rng = random.Random(0)
+    texts = [' '.join(rng.choice(BENIGN_WORDS) + str(rng.randrange(10 ** 6)) for _ in range(200))
+             for _ in range(300)]
+    assert not scorer.term_scores(texts).any()
+    assert not scorer.score_batch((text, 'blog') for text in texts).any()
+
+
+def test_terms_and_phrases_are_scored():
+    scorer = RiskScorer({})
+    scores = scorer.term_scores(['selling ransomware here', 'a zero day for sale', 'zero and day apart'])
+    assert scores[0] == DEFAULT_RISK_TERMS['ransomware']
+    assert abs(scores[1] - DEFAULT_RISK_TERMS['zero day']) < 1e-5
+    assert scores[2] == 0
@@ -0,0 +1,55 @@
+import threading
+from search_cache import SearchCache
+
+
+def cached_rows(db_manager):
+    return db_manager.reader().execute('SELECT cache_key FROM search_cache ORDER BY cache_key').fetchall()
+
+
+def test_invalidation_deletes_are_coalesced_into_the_next_flush(db_manager):
+    cache = SearchCache(db_manager, persistent=True)
+    cache.put('scoped', [{'url': 'http://a.onion/'}], sources=['http://a.onion/'])
+    cache.put('other', [{'url': 'http://b.onion/'}], sources=['http://b.onion/'])
+    for _ in range(50):
+        db_manager.store_website('http://a.onion/', 'a', 'changed', 'website', 'Unknown', defer=True)
+    # Nothing is deleted until the batch writer flushes, and then once per url
+    assert cached_rows(db_manager) == [('other',), ('scoped',)]
+    db_manager.flush()
+    assert cached_rows(db_manager) == [('other',)]
+
+
+def test_stored_entries_of_changed_pages_are_not_served(db_manager):
+    cache = SearchCache(db_manager, persistent=True)
+    cache.put('scoped', [{'url': 'http://a.onion/'}], sources=['http://a.onion/'])
+    db_manager.store_website('http://a.onion/', 'a', 'changed', 'website', 'Unknown')
+    # The memory entry is gone at once; the stored one must not be loaded back before its delete lands
+    assert cache.get('scoped') is None
+    assert cached_rows(db_manager) == []
+
+
+def test_invalidation_is_safe_alongside_lookups(db_manager):
+    cache = SearchCache(db_manager, max_entries=64)
+    errors = []
+
+    def search():
+        try:
+            for i in range(2000):
+                key = f'k{i % 100}'
+                if cache.get(key) is None:
+                    cache.put(key, [], sources=[f'http://{i % 7}.onion/'])
+        except Exception as e:
+            errors.append(e)
+
+    def crawl():
+        try:
+            for i in range(2000):
+                cache.invalidate([f'http://{i % 7}.onion/'])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target) for target in (search, search, crawl, crawl)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,54 @@
+from search_engine import SearchEngine
+
+
+class NoAlerts:
+    def check_keyword_risk(self, keyword, result_count):
+        pass
+
+    def check_result_alerts(self, result):
+        pass
+
+    def check_keyword_alerts(self, keyword, results):
+        pass
+
+
+def test_cached_results_are_not_shared_with_callers(db_manager):
+    db_manager.store_website('http://market.onion/', 'Market', 'escrow vendor listings', 'marketplace', 'Unknown')
+    engine = SearchEngine(db_manager, NoAlerts())
+    first = engine.search(['escrow'])
+    assert first
+    first[0]['title'] = 'edited'
+    second = engine.search(['escrow'])
+    assert second[0]['title'] == 'Market'
+    second[0]['title'] = 'edited again'
+    assert engine.search(['escrow'])[0]['title'] == 'Market'
+
+
+class StaleSession:
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, timeout=None, headers=None, proxies=None):
+        self.requests.append(url)
+        response = type('Response', (), {})()
+        response.status_code, response.headers = 200, {}
+        response.content = b'<html><title>Fresh</title>escrow</html>'
+        response.raise_for_status = lambda: None
+        return response
+
+    def close(self):
+        pass
+
+
+def test_refreshing_stale_pages_keeps_a_paused_crawl(db_manager, monkeypatch):
+    session = StaleSession()
+    monkeypatch.setattr('crawler.DarkWebCrawler._new_session', lambda self: session)
+    db_manager.store_website('http://stale.onion/', 'Old', 'escrow', 'website', 'Unknown')
+    db_manager.execute_batches([("UPDATE websites SET last_seen = '2000-01-01'", [()])])
+    db_manager.checkpoint_crawl([('http://left.onion/', 1, 'http://left.onion/')], [])
+
+    engine = SearchEngine(db_manager, NoAlerts())
+    engine.set_proxy()
+    engine.search(['escrow'], refresh_stale=True)
+    assert session.requests == ['http://stale.onion/']
+    assert db_manager.get_crawl_frontier() == [('http://left.onion/', 1, 'http://left.onion/')]
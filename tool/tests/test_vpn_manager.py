@@ -0,0 +1,64 @@
+import os
+import time
+import threading
+import pytest
+import vpn_manager
+from vpn_manager import VPNManager
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'openvpn_stub.py')
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    configs = []
+    for name in ('first', 'second'):
+        path = tmp_path / f'{name}.ovpn'
+        path.write_text('stub-connect-delay 0.1\n')
+        configs.append({'config_path': str(path), 'auth_path': str(tmp_path / 'auth.txt')})
+    monkeypatch.setitem(vpn_manager.VPN_CONFIG, 'openvpn_path', STUB)
+    monkeypatch.setitem(vpn_manager.VPN_CONFIG, 'configs', configs)
+    manager = VPNManager()
+    yield manager
+    manager.stop_rotation()
+
+
+def test_rotation_drains_in_flight_requests_before_switching(manager):
+    assert manager.start_rotation(interval=0.3, drain_timeout=10)
+    wait_until(lambda: manager.state == VPNManager.CONNECTED)
+    first = manager.current_config
+    admitted = []
+
+    def late_request():
+        with manager.gate.request(timeout=10):
+            admitted.append((manager.generation, manager.current_config))
+
+    with manager.gate.request(timeout=1):
+        wait_until(lambda: manager.state == VPNManager.DRAINING)
+        waiter = threading.Thread(target=late_request)
+        waiter.start()
+        time.sleep(0.3)
+        # The tunnel stays up while a request is in flight, and new requests are held at the gate
+        assert manager.current_config == first and manager.is_connected()
+        assert admitted == []
+    waiter.join(10)
+    assert admitted == [(2, manager.current_config)] and admitted[0][1] != first
+
+
+def test_stop_rotation_joins_the_loop(manager):
+    manager.start_rotation(interval=60)
+    wait_until(lambda: manager.state == VPNManager.CONNECTED)
+    thread, process = manager._rotation_thread, manager.process
+    start = time.monotonic()
+    manager.stop_rotation()
+    assert time.monotonic() - start < 5
+    assert not thread.is_alive() and manager._rotation_thread is None
+    assert process.poll() is not None and manager.state == VPNManager.DISCONNECTED
+    assert not manager.gate.is_open
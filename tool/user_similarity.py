@@ -0,0 +1,72 @@
+import random
+import struct
+import hashlib
+
+# Mersenne prime used for the universal hash family of the permutations
+_PRIME = (1 << 61) - 1
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'big') % _PRIME
+
+
+class MinHashLSH:
+    """
+    MinHash signatures over a name's character n-grams, split into LSH bands.
+
+    Two names with Jaccard similarity s share at least one band key with
+    probability 1 - (1 - s**rows)**bands, so the band keys index a
+    candidate set that is re-ranked exactly. Hashing is seeded, so keys are
+    stable across processes and restarts.
+    """
+
+    def __init__(self, bands=32, rows=6, ngram=1, seed=1):
+        self.bands = bands
+        self.rows = rows
+        self.ngram = ngram
+        rng = random.Random(seed)
+        self.perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(bands * rows)]
+        self._cache = {}            # token -> its value under every permutation
+        # Below this similarity a pair is more likely missed than found
+        self.min_threshold = (1 / bands) ** (1 / rows)
+
+    def tokens(self, name):
+        name = name.lower()
+        if self.ngram == 1:
+            return set(name)
+        return {name[i:i + self.ngram] for i in range(max(len(name) - self.ngram + 1, 1))}
+
+    def _permuted(self, token):
+        values = self._cache.get(token)
+        if values is None:
+            h = _token_hash(token)
+            values = [(a * h + b) % _PRIME for a, b in self.perms]
+            if len(self._cache) < 100000:
+                self._cache[token] = values
+        return values
+
+    def signature(self, name):
+        vectors = [self._permuted(token) for token in self.tokens(name)]
+        if not vectors:
+            return [0] * len(self.perms)
+        return list(map(min, *vectors)) if len(vectors) > 1 else list(vectors[0])
+
+    def band_keys(self, name):
+        """Return one signed 64-bit key per band, suitable for an SQLite INTEGER column."""
+        signature = self.signature(name)
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(struct.pack(f'>H{self.rows}Q', band, *chunk), digest_size=8).digest()
+            keys.append(int.from_bytes(digest, 'big', signed=True))
+        return keys
+
+    def rows_for(self, name):
+        """(band, key, name) rows to index `name` under."""
+        return [(band, key, name) for band, key in enumerate(self.band_keys(name))]
+
+
+# Index used by DataBaseManager.store_user; changing it needs a rebuild of user_lsh.
+# Character sets of unrelated names overlap a lot, so long bands keep buckets
+# small: a 0.7-similar pair is still found with probability 0.98.
+USER_LSH = MinHashLSH(bands=32, rows=6)
@@ -1,10 +1,12 @@
 import re
-import json
 from datetime import datetime, timedelta
+from user_similarity import USER_LSH
+from alias_clusters import AliasClusterer
 
 class UserTracker:
     def __init__(self, db_manager):
         self.db_manager = db_manager
+        self.aliases = AliasClusterer(db_manager)
 
     # ---------------- Track a User ----------------
     def track_user(self, username: str, pgp_key: str = None, email: str = None) -> dict | None:
@@ -21,8 +23,8 @@ class UserTracker:
             username=user_info['username'],
             pgp_key=user_info['pgp_key'],
             email=user_info['email'],
-            marketplaces=json.dumps(user_info['marketplaces']),
-            products=json.dumps(user_info['products']),
+            marketplaces=user_info['marketplaces'],
+            products=user_info['products'],
             geo_location=user_info['geo_location'],
             risk_level=user_info['risk_level']
         ):
@@ -49,24 +51,63 @@ class UserTracker:
             "risk_level": 7
         }
 
+    # ---------------- Alias Clusters ----------------
+    def cluster_aliases(self) -> int:
+        """
+        Recompute every identity cluster from scratch. Users tracked later are
+        merged into the clusters as they are looked up.
+        """
+        return self.aliases.rebuild()
+
+    def get_alias_cluster(self, username: str) -> list:
+        """Return every username linked to `username` by name similarity, PGP key or email."""
+        return self.aliases.get_cluster(username)
+
     # ---------------- Find Similar Users ----------------
     def find_similar_users(self, username: str, threshold: float = 0.7) -> list:
         """
-        Find usernames similar to the given username based on character overlap.
+        Find usernames similar to the given username based on character overlap,
+        most similar first.
+        """
+        return self.find_similar_users_batch([username], threshold).get(username, [])
+
+    def find_similar_users_batch(self, usernames: list, threshold: float = 0.7) -> dict:
+        """
+        Find similar usernames for many usernames at once.
+        Returns {username: [similar usernames, most similar first]}.
         """
-        cursor = self.db_manager.conn.cursor()
         try:
-            cursor.execute('SELECT username FROM users')
-            all_users = [row[0] for row in cursor.fetchall()]
+            if threshold < USER_LSH.min_threshold:
+                # LSH would miss too many pairs this far below its design point
+                cursor = self.db_manager.reader().cursor()
+                cursor.execute('SELECT username FROM users')
+                all_users = [row[0] for row in cursor.fetchall()]
+                candidates = {username: all_users for username in usernames}
+            else:
+                self.db_manager.flush()
+                candidates = self.db_manager.get_lsh_candidates(
+                    {username: USER_LSH.band_keys(username) for username in usernames}
+                )
 
-            similar_users = [
-                user for user in all_users
-                if user != username and self._similarity_score(username, user) >= threshold
-            ]
-            return similar_users
+            similar = {}
+            for username, users in candidates.items():
+                # Same score as _similarity_score, with the query's set built once
+                query = set(username.lower())
+                scored = []
+                for user in users:
+                    if user == username:
+                        continue
+                    chars = set(user.lower())
+                    shared = len(query & chars)
+                    union = len(query) + len(chars) - shared
+                    score = shared / union if union else 0.0
+                    if score >= threshold:
+                        scored.append((score, user))
+                similar[username] = [user for _, user in sorted(scored, key=lambda item: (-item[0], item[1]))]
+            return similar
         except Exception as e:
             print(f"[-] Error finding similar users: {str(e)}")
-            return []
+            return {}
 
     # ---------------- Similarity Score ----------------
     def _similarity_score(self, str1: str, str2: str) -> float:
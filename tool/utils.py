@@ -30,6 +30,9 @@ def format_timestamp(timestamp=None):
         timestamp = datetime.now()
     return timestamp.strftime("%Y-%m-%d %H:%M:%S")
 
-def calculate_risk_score(content):
-    """Calculate a risk score based on content"""
+def calculate_risk_score(content, page_type=None):
+    """Calculate a risk score from 0 to 10 based on content and page type"""
+    # Imported here so utils stays usable without numpy and the alert rules
+    from risk_scoring import default_scorer
+    return default_scorer().score(content, page_type)
     
\ No newline at end of file
@@ -1,15 +1,75 @@
 import subprocess
+import threading
 import time
 import os
+from contextlib import contextmanager
 from config import VPN_CONFIG
+from proxy_health import vpn_target
 
 
-class VPNManager:
+class TrafficGate:
+    """
+    Admits requests while open and counts those in flight. Closing the gate
+    holds new requests back, so a tunnel switch can wait for in-flight ones
+    to finish instead of cutting them off.
+    """
+
     def __init__(self):
+        self.condition = threading.Condition()
+        self.is_open = False
+        self.in_flight = 0
+
+    @contextmanager
+    def request(self, timeout=None):
+        """Hold a request slot; waits up to `timeout` seconds for the gate to open."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.is_open, timeout):
+                raise ConnectionError("VPN tunnel is not available")
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.is_open = False
+
+    def open(self):
+        with self.condition:
+            self.is_open = True
+            self.condition.notify_all()
+
+    def drain(self, timeout=None):
+        """Close the gate and wait for in-flight requests; False if some remain after `timeout`."""
+        with self.condition:
+            self.is_open = False
+            return self.condition.wait_for(lambda: self.in_flight == 0, timeout)
+
+
+class VPNManager:
+    DISCONNECTED = 'disconnected'
+    CONNECTING = 'connecting'
+    CONNECTED = 'connected'
+    DRAINING = 'draining'
+
+    def __init__(self, health=None):
         self.process = None
+        self.health = health            # a ProxyHealthMonitor; demoted configs are skipped by rotation
         self.connected = False
+        self.gate = TrafficGate()
+        self.state = self.DISCONNECTED
+        self.current_config = None
+        self.connected_since = None
+        self.generation = 0             # bumped on every new tunnel; pooled connections of older ones are stale
+        self.rotations = 0
+        self._stop = threading.Event()
+        self._rotation_thread = None
+        self._log_thread = None
 
-    def _connect_single(self, openvpn_path, config_path, auth_path):
+    def _connect_single(self, openvpn_path, config_path, auth_path, timeout=None):
         """Connect to a single VPN config"""
         print(f"[+] Connecting to VPN using {config_path}")
 
@@ -29,72 +89,176 @@ class VPNManager:
         ]
 
         try:
+            self.state = self.CONNECTING
             self.process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
                 text=True
             )
 
-            # Check connection status
-            timeout = 25  # seconds
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                output = self.process.stdout.readline()
-                if output:
-                    print(output.strip())
-                    if "Initialization Sequence Completed" in output:
-                        print(f"[+] Connected with {config_path}")
-                        self.connected = True
-                        return True
-                if self.process.poll() is not None:
-                    stdout, stderr = self.process.communicate()
-                    print(f"[-] VPN exited early:\n{stdout}\n{stderr}")
-                    return False
-
-            print("[-] VPN connection timed out.")
-            return False
+            # The log is followed on its own thread, so the timeout holds while
+            # openvpn is silent and the pipe keeps draining once connected
+            progress = {'initialized': False, 'ended': threading.Event()}
+            self._log_thread = threading.Thread(target=self._follow_log, args=(self.process, progress),
+                                                name='openvpn-log', daemon=True)
+            self._log_thread.start()
+
+            timeout = timeout or VPN_CONFIG.get('connect_timeout', 25)
+            progress['ended'].wait(timeout)
+            if not progress['initialized'] and progress['ended'].is_set():
+                print(f"[-] VPN exited early with code {self.process.wait()}")
+                self.process = None
+                self.state = self.DISCONNECTED
+                return False
+            if not progress['initialized']:
+                print("[-] VPN connection timed out.")
+                self.disconnect()
+                return False
+
+            print(f"[+] Connected with {config_path}")
+            self.connected = True
+            self.state = self.CONNECTED
+            self.current_config = config_path
+            self.connected_since = time.time()
+            self.generation += 1
+            if self.health:
+                self.health.register(vpn_target(config_path))
+            self.gate.open()
+            return True
 
         except Exception as e:
             print(f"[-] VPN connection error: {str(e)}")
+            self.state = self.DISCONNECTED
             return False
 
+    def _follow_log(self, process, progress):
+        for line in process.stdout:
+            print(line.strip())
+            if "Initialization Sequence Completed" in line:
+                progress['initialized'] = True
+                progress['ended'].set()
+        # The log ends when the process exits: wake a waiting connect, and stop
+        # admitting requests at once if this was the live tunnel
+        if process is self.process and progress['initialized']:
+            print("[-] VPN tunnel dropped; holding requests")
+            self.gate.close()
+        progress['ended'].set()
+
     def disconnect(self):
         """Disconnect VPN"""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
-        self.process = None
+        self.gate.close()
+        process, self.process = self.process, None
+        if process:
+            process.terminate()
+            process.wait()
         self.connected = False
+        self.state = self.DISCONNECTED
+        self.current_config = None
+        self.connected_since = None
         print("[+] VPN disconnected")
 
     def is_connected(self):
         return self.connected and self.process and self.process.poll() is None
 
-    def rotate_connections(self, interval=600):
-        """Rotate VPN servers every X seconds (default = 10 minutes)"""
-        configs = VPN_CONFIG.get("configs", [])
+    def status(self):
+        """Connection state for the crawler and for display."""
+        return {
+            'state': self.state,
+            'connected': bool(self.is_connected()),
+            'config': self.current_config,
+            'connected_since': self.connected_since,
+            'generation': self.generation,
+            'rotations': self.rotations,
+            'in_flight': self.gate.in_flight,
+            'accepting': self.gate.is_open
+        }
 
+    # ---------------- Rotation ----------------
+    def start_rotation(self, interval=None, drain_timeout=None):
+        """
+        Rotate through VPN_CONFIG['configs'] on a background thread, one
+        tunnel every `interval` seconds. Before each switch the gate stops
+        admitting new requests and waits up to `drain_timeout` seconds for
+        in-flight ones, then the tunnel is replaced and requests resume.
+        While no tunnel is up the gate stays closed, so traffic never
+        leaves outside the VPN.
+        """
+        configs = VPN_CONFIG.get("configs", [])
         if not configs:
             print("[-] No VPN configs found in VPN_CONFIG")
-            return
+            return False
+        if self._rotation_thread and self._rotation_thread.is_alive():
+            return True
+
+        interval = interval or VPN_CONFIG.get('rotation_interval', 600)
+        drain_timeout = drain_timeout if drain_timeout is not None else VPN_CONFIG.get('drain_timeout', 30)
+        self._stop.clear()
+        self._rotation_thread = threading.Thread(target=self._rotation_loop, args=(configs, interval, drain_timeout),
+                                                 name='vpn-rotation', daemon=True)
+        self._rotation_thread.start()
+        return True
 
+    def stop_rotation(self, disconnect=True):
+        self._stop.set()
+        if self._rotation_thread:
+            self._rotation_thread.join()
+            self._rotation_thread = None
+        if disconnect:
+            self.disconnect()
+
+    def _rotation_loop(self, configs, interval, drain_timeout):
         idx = 0
-        while True:
-            cfg = configs[idx]
-            print(f"\n[=] Switching to config: {cfg['config_path']}")
-            
-            success = self._connect_single(
-                VPN_CONFIG["openvpn_path"],
-                cfg["config_path"],
-                cfg["auth_path"]
-            )
+        while not self._stop.is_set():
+            if self.process:
+                self.state = self.DRAINING
+                if not self.gate.drain(drain_timeout):
+                    print(f"[-] {self.gate.in_flight} requests still in flight after {drain_timeout}s; rotating anyway")
+                self.disconnect()
 
-            if not success:
+            # Try each config once per round until one connects
+            for _ in range(len(configs)):
+                cfg = configs[idx]
+                idx = (idx + 1) % len(configs)
+                if self._demoted(cfg, configs):
+                    print(f"[*] Skipping demoted config: {cfg['config_path']}")
+                    continue
+                print(f"\n[=] Switching to config: {cfg['config_path']}")
+                if self._connect_single(VPN_CONFIG["openvpn_path"], cfg["config_path"], cfg["auth_path"]):
+                    self.rotations += 1
+                    break
                 print("[-] Failed to connect, skipping to next...")
+                if self._stop.is_set():
+                    return
             else:
-                time.sleep(interval)  # stay connected for 10 min
-                self.disconnect()
+                print("[-] No VPN config connected; holding requests until the next attempt")
+
+            self._hold(interval if self.connected else min(interval, 30))
+
+    def _hold(self, seconds):
+        """Keep the current tunnel for `seconds`, or until it drops or is demoted."""
+        deadline = time.monotonic() + seconds
+        while not self._stop.wait(max(0, min(1, deadline - time.monotonic()))):
+            if time.monotonic() >= deadline:
+                return
+            if self.process and not self.is_connected():
+                print("[*] Reconnecting after the dropped tunnel")
+                return
+            if self.health and self.current_config and self.health.is_demoted(vpn_target(self.current_config)):
+                print("[*] Rotating early away from a demoted tunnel")
+                return
 
-            # Rotate to next config
-            idx = (idx + 1) % len(configs)
+    def _demoted(self, cfg, configs):
+        """True if `cfg` is demoted and some other config is not."""
+        if not self.health or not self.health.is_demoted(vpn_target(cfg['config_path'])):
+            return False
+        return any(not self.health.is_demoted(vpn_target(other['config_path'])) for other in configs)
+
+    def rotate_connections(self, interval=600):
+        """Rotate VPN servers every X seconds (default = 10 minutes), blocking the calling thread."""
+        if self.start_rotation(interval):
+            try:
+                while self._rotation_thread.is_alive():
+                    self._rotation_thread.join(1)
+            except KeyboardInterrupt:
+                self.stop_rotation()